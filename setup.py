@@ -12,4 +12,7 @@ setup(
     long_description=long_description,
     author='Joel McCune (https://github.com/knu2xs)',
     license='Apache 2.0',
+    entry_points={
+        'console_scripts': ['river-levels=river_levels.cli:main'],
+    },
 )
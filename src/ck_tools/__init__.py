@@ -1,5 +1,8 @@
-__all__ = ['add_group', 'create_local_data_resources', 'paths', 'create_aoi_mask_layer']
+__all__ = ['add_group', 'add_directory_to_gis', 'clear_cache', 'create_local_data_resources', 'get_gis', 'paths',
+           'create_aoi_mask_layer', 'FeatureLayerPublisher', 'gauge_feature']
 
-from .main import add_group, create_local_data_resources, Paths, create_aoi_mask_layer
+from .main import add_group, add_directory_to_gis, clear_cache, create_local_data_resources, get_gis, Paths, \
+    create_aoi_mask_layer
+from .publish import FeatureLayerPublisher, gauge_feature
 
 paths = Paths()
\ No newline at end of file
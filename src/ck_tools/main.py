@@ -1,11 +1,14 @@
+import json
 import os
 import re
 import importlib.util
 from pathlib import Path
 import shutil
+import time
+import weakref
 
+from arcgis import env
 from arcgis.gis import GIS, Group
-from arcgis.env import active_gis
 from dotenv import find_dotenv, load_dotenv
 
 # see if arcpy available to accommodate non-windows environments
@@ -28,11 +31,65 @@ def _not_none_and_len(string: str) -> bool:
     return status
 
 
-def get_gis():
-    """Try to get a GIS object first from an active_gis and then trying to create from the .env file."""
+# seconds a GIS login is reused before logging in again, kept under the default token expiration of an hour
+GIS_SESSION_TTL = 50 * 60
+
+# seconds resolved groups and folders are remembered before asking the GIS again
+RESOURCE_CACHE_TTL = 5 * 60
+
+# logins created from the .env file, keyed by (url, username), with the time each was created
+_gis_cache = {}
+
+
+class _ResourceCache(object):
+    """Short-lived cache of resources already resolved in a GIS, keyed by the GIS instance and a lowercase name."""
+
+    def __init__(self, ttl: float = None) -> None:
+        self.ttl = ttl
+        self._cache = weakref.WeakKeyDictionary()
+
+    def get(self, gis: GIS, name: str):
+        """Get a cached resource, or None if not cached or the cached value has expired."""
+        ttl = RESOURCE_CACHE_TTL if self.ttl is None else self.ttl
+        val, ts = self._cache.get(gis, {}).get(name.lower(), (None, 0.0))
+        return val if time.monotonic() - ts < ttl else None
+
+    def set(self, gis: GIS, name: str, value) -> None:
+        """Save a resolved resource into the cache."""
+        self._cache.setdefault(gis, {})[name.lower()] = (value, time.monotonic())
+
+    def clear(self) -> None:
+        """Remove everything from the cache."""
+        self._cache.clear()
+
+
+_group_cache = _ResourceCache()
+_folder_cache = _ResourceCache()
+
+
+def clear_cache() -> None:
+    """Clear cached GIS logins along with the groups and folders already resolved."""
+    _gis_cache.clear()
+    _group_cache.clear()
+    _folder_cache.clear()
+
+
+def get_gis(refresh: bool = False):
+    """
+    Try to get a GIS object first from an active_gis and then trying to create from the .env file.
+
+    Logins created from the .env file are cached and reused by subsequent calls until approaching token expiration
+    (``GIS_SESSION_TTL``), when a fresh login is created.
+
+    Args:
+        refresh: Optional
+            Ignore any cached login and log in again.
+
+    Returns: GIS or None if no active GIS or credentials are available.
+    """
     # if there is an active_gis, just use it
-    if isinstance(active_gis, GIS):
-        gis = active_gis
+    if isinstance(env.active_gis, GIS):
+        gis = env.active_gis
 
     # if not an active_gis, see what may be available in the .env file
     else:
@@ -40,13 +97,21 @@ def get_gis():
         usr = os.getenv('ESRI_GIS_USERNAME')
         pswd = os.getenv('ESRI_GIS_PASSWORD')
 
-        # if credentials are found, use them to create a gis (url is not needed since defaults to AGOL)
-        if url is not None and usr is not None and pswd is not None:
-            gis = GIS(url, username=usr, password=pswd)
-        elif usr is not None and pswd is not None:
-            gis = GIS(username=usr, password=pswd)
-        else:
-            gis = None
+        # without credentials, there is nothing to log in with
+        if usr is None or pswd is None:
+            return None
+
+        # reuse a cached login if it is not getting close to expiring
+        gis, ts = _gis_cache.get((url, usr), (None, 0.0))
+        if refresh or gis is None or time.monotonic() - ts >= GIS_SESSION_TTL:
+
+            # if credentials are found, use them to create a gis (url is not needed since defaults to AGOL)
+            if url is not None:
+                gis = GIS(url, username=usr, password=pswd)
+            else:
+                gis = GIS(username=usr, password=pswd)
+
+            _gis_cache[(url, usr)] = (gis, time.monotonic())
 
     return gis
 
@@ -65,6 +130,10 @@ def add_group(gis: GIS = None, group_name: str = None) -> Group:
 
     Returns: Group
     """
+    # try to figure out what GIS to use
+    if gis is None:
+        gis = get_gis()
+
     # if no group name provided
     if group_name is None:
 
@@ -75,11 +144,16 @@ def add_group(gis: GIS = None, group_name: str = None) -> Group:
         assert isinstance(group_name, str), err_msg
         assert len(group_name), err_msg
 
+    # if already resolved recently, no need to ask the GIS again
+    grp = _group_cache.get(gis, group_name)
+    if grp is not None:
+        return grp
+
     # create an instance of the group manager
     gmgr = gis.groups
 
-    # determine if group exists
-    grp_srch = [g for g in gmgr.search() if g.title.lower() == group_name.lower()]
+    # determine if group exists, searching by title on the server and confirming the exact match locally
+    grp_srch = [g for g in gmgr.search(query=f'title:"{group_name}"') if g.title.lower() == group_name.lower()]
 
     # if the group does not exist
     if len(grp_srch) == 0:
@@ -94,6 +168,8 @@ def add_group(gis: GIS = None, group_name: str = None) -> Group:
     else:
         grp = grp_srch[0]
 
+    _group_cache.set(gis, group_name, grp)
+
     return grp
 
 
@@ -113,22 +189,165 @@ def add_directory_to_gis(dir_name: str = None, gis: GIS = None):
     assert isinstance(gis, GIS), 'A GIS instance, either an active_gis in the session, credentials in the .env file, ' \
                                  'or an active GIS instance explicitly passed into the "gis" parameter.'
 
-    # create the directory
-    res = gis.content.create_folder(dir_name)
+    # if already resolved recently, no need to ask the GIS again
+    if _folder_cache.get(gis, dir_name) is not None:
+        return True
 
-    # if the response is None, the folder already exists, so don't worry about it
-    if res is None:
-        status = True
+    # current versions of the API manage folders as objects, creating the folder only if it does not exist
+    if hasattr(gis.content, 'folders'):
+        fldr = gis.content.folders.get(dir_name)
+        if fldr is None:
+            fldr = gis.content.folders.create(dir_name, exist_ok=True)
+        status = fldr is not None
 
-    # otherwise, set status based on if the title is in the response
+    # older versions list folders as dictionaries
     else:
-        status = 'title' in res.keys()
+
+        # check the user's folders for the directory before trying to create it
+        fldr_srch = [f for f in gis.users.me.folders
+                     if getattr(f, 'properties', f)['title'].lower() == dir_name.lower()]
+
+        if len(fldr_srch):
+            status = True
+
+        else:
+
+            # create the directory
+            res = gis.content.create_folder(dir_name)
+
+            # if the response is None, the folder already exists, so don't worry about it
+            if res is None:
+                status = True
+
+            # otherwise, set status based on if the title is in the response
+            else:
+                status = 'title' in res.keys()
+
+    if status:
+        _folder_cache.set(gis, dir_name, True)
 
     return status
 
 
-def create_local_data_resources(data_pth: Path = None, mobile_geodatabases=False) -> Path:
-    """create all the data resources for the available environment"""
+# name of the file recording the versions geodatabases were created with, saved in the data directory
+RESOURCE_STATE_FILE = '.resources.json'
+
+# geodatabase type for each supported suffix
+_gdb_types = {
+    '.gdb': 'file',
+    '.geodatabase': 'mobile'
+}
+
+
+def _get_pro_version() -> str:
+    """Get the version of ArcGIS Pro geodatabases are created with."""
+    return arcpy.GetInstallInfo()['Version'] if has_arcpy else None
+
+
+def _create_gdb(pth: Path) -> None:
+    """Create a file or mobile geodatabase depending on the path suffix."""
+    if pth.suffix == '.gdb':
+        arcpy.management.CreateFileGDB(str(pth.parent), pth.name)
+    else:
+        arcpy.management.CreateMobileGDB(str(pth.parent), pth.name)
+
+
+def _delete_gdb(pth: Path) -> None:
+    """Remove a file (directory) or mobile (sqlite file) geodatabase."""
+    if pth.is_dir():
+        shutil.rmtree(pth)
+    else:
+        pth.unlink()
+
+
+def _provision_resources(pth_lst: list, state_pth: Path) -> dict:
+    """
+    Create directories and geodatabases only if missing, recreating geodatabases only if the version of ArcGIS Pro
+    or the geodatabase type differs from what is recorded in the state file.
+
+    Args:
+        pth_lst: Paths to directories and geodatabases to be provisioned.
+        state_pth: JSON file recording the type and Pro version each geodatabase was created with.
+
+    Returns: Dictionary of the paths 'created', 'rebuilt', already 'existing', and 'skipped' since arcpy is not
+        available to create geodatabases.
+    """
+    report = {'created': [], 'rebuilt': [], 'existing': [], 'skipped': []}
+
+    # load the versions recorded by previous runs
+    state = json.loads(state_pth.read_text()) if state_pth.exists() else {}
+    state_changed = False
+
+    pro_version = _get_pro_version()
+
+    # provision directories before the geodatabases they contain, and remove duplicates
+    pth_lst = sorted(set(Path(p) for p in pth_lst), key=lambda p: (p.suffix in _gdb_types, str(p)))
+
+    for pth in pth_lst:
+
+        # directories simply need to exist
+        if pth.suffix not in _gdb_types:
+            if pth.exists():
+                report['existing'].append(pth)
+            else:
+                pth.mkdir(parents=True)
+                report['created'].append(pth)
+            continue
+
+        # geodatabases require arcpy
+        if not has_arcpy:
+            report['skipped'].append(pth)
+            continue
+
+        # make sure the directory for the geodatabase exists
+        if not pth.parent.exists():
+            pth.parent.mkdir(parents=True)
+            report['created'].append(pth.parent)
+
+        key = os.path.relpath(pth, state_pth.parent)
+        current = {'type': _gdb_types[pth.suffix], 'pro_version': pro_version}
+        recorded = state.get(key)
+
+        # only recreate if created with a different version of Pro or as a different type
+        if pth.exists() and recorded is not None and recorded != current:
+            _delete_gdb(pth)
+            _create_gdb(pth)
+            report['rebuilt'].append(pth)
+
+        elif pth.exists():
+            report['existing'].append(pth)
+
+        else:
+            _create_gdb(pth)
+            report['created'].append(pth)
+
+        if recorded != current:
+            state[key] = current
+            state_changed = True
+
+    # save the versions for the next run
+    if state_changed:
+        state_pth.parent.mkdir(parents=True, exist_ok=True)
+        state_pth.write_text(json.dumps(state, indent=2, sort_keys=True))
+
+    return report
+
+
+def create_local_data_resources(data_pth: Path = None, mobile_geodatabases=False) -> dict:
+    """
+    Create all the data resources for the available environment. Only missing resources are created, and
+    geodatabases are only recreated if ArcGIS Pro has been upgraded since they were created, so running this again
+    does not touch existing data.
+
+    Args:
+        data_pth: Optional
+            Path to the data directory. Default is the data directory in the project.
+        mobile_geodatabases: Optional
+            Also create mobile geodatabases alongside the file geodatabases.
+
+    Returns: Dictionary of the paths 'created', 'rebuilt', already 'existing', and 'skipped' since arcpy is not
+        available to create geodatabases.
+    """
     # default to the expected project structure
     if data_pth is None:
         data_pth = Path(__file__).parent.parent.parent / 'data'
@@ -136,31 +355,15 @@ def create_local_data_resources(data_pth: Path = None, mobile_geodatabases=False
     # cover if a string is inadvertently passed in as the path
     data_pth = Path(data_pth) if isinstance(data_pth, str) else data_pth
 
-    # iterate the data subdirectories
+    # build the manifest of the data subdirectories and geodatabases
+    pth_lst = []
     for data_name in ['interim', 'raw', 'processed', 'external']:
-
-        # ensure the data subdirectory exists
         dir_pth = data_pth / data_name
-        if not dir_pth.exists():
-            dir_pth.mkdir(parents=True)
-
-        # if working in an arcpy environment
-        if has_arcpy:
+        pth_lst.extend([dir_pth, dir_pth / f'{data_name}.gdb'])
+        if mobile_geodatabases:
+            pth_lst.append(dir_pth / f'{data_name}.geodatabase')
 
-            # remove the file geodatabase if it exists and recreate it to make sure compatible with version of Pro
-            fgdb_pth = dir_pth / f'{data_name}.gdb'
-            if fgdb_pth.exists():
-                shutil.rmtree(fgdb_pth)
-            arcpy.management.CreateFileGDB(str(dir_pth), f'{data_name}.gdb')
-
-            # do the same thing for a mobile geodatabase, a sqlite database
-            if mobile_geodatabases:
-                gdb_pth = dir_pth / f'{data_name}.geodatabase'
-                if gdb_pth.exists():
-                    gdb_pth.unlink()
-                arcpy.management.CreateMobileGDB(str(dir_pth), f'{data_name}.geodatabase')
-
-    return data_pth
+    return _provision_resources(pth_lst, data_pth / RESOURCE_STATE_FILE)
 
 
 class Paths:
@@ -189,46 +392,20 @@ class Paths:
     dir_arcgis = dir_prj / 'arcgis'
     dir_arcgis_lyrs = dir_arcgis / 'layer_files'
 
-    @staticmethod
-    def _create_resource(pth: Path) -> Path:
-        """Internal function to create resources."""
-
-        # see if we're working with a file geodatabase
-        is_gdb = (pth.suffix == '.gdb' or pth.suffix == '.geodatabase')
-
-        # if a geodatabase, the path dir is one level up
-        pth_dir = pth.parent if is_gdb else pth
-
-        # ensure the file directory exists including parents as necessary
-        if not pth_dir.exists():
-            pth_dir.mkdir(parents=True)
-
-        # now if a geodatabase, create it
-        if is_gdb:
-
-            # flag if-exists so only run function once
-            gdb_exists = arcpy.Exists(str(pth))
-
-            # if a file geodatabase, create it
-            if pth.suffix == '.gdb' and not gdb_exists:
-                arcpy.management.CreateFileGDB(pth_dir, pth.stem)
-
-            # if a mobile geodatabase, create it
-            if pth.suffix == '.geodatabase' and not gdb_exists:
-                arcpy.management.CreateMobileGDB(pth_dir, pth.stem)
-
-        return pth
-
-    def create_resources(self):
-        """Create data storage resources if they do not already exist."""
-        # get the data resources from the object properties
-        pth_lst = [p for p in dir(self) if isinstance(p, Path)]
+    @property
+    def manifest(self) -> dict:
+        """Dictionary of the path attribute names and the project resources they reference."""
+        return {nm: getattr(self, nm) for nm in dir(self)
+                if not nm.startswith('_') and nm != 'manifest' and isinstance(getattr(self, nm), Path)}
 
-        # iterate the paths and create any necessary resources
-        for pth in pth_lst:
-            self._create_resource(pth)
+    def create_resources(self) -> dict:
+        """
+        Create data storage resources if they do not already exist.
 
-        return
+        Returns: Dictionary of the paths 'created', 'rebuilt', already 'existing', and 'skipped' since arcpy is not
+            available to create geodatabases.
+        """
+        return _provision_resources(list(self.manifest.values()), self.dir_data / RESOURCE_STATE_FILE)
 
 
 def create_aoi_mask_layer(aoi_feature_layer, output_feature_class, style_layer=None):
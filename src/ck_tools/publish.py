@@ -0,0 +1,225 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Iterable, List, Union
+
+import pandas as pd
+from river_levels.sources import normalize_metrics
+
+__all__ = ['FeatureLayerPublisher', 'gauge_feature']
+
+# batch size used if the feature layer does not report a maximum record count
+DEFAULT_BATCH_SIZE = 250
+
+# decimal places geometry coordinates are compared to when looking for changes
+_coord_precision = 7
+
+
+def _to_epoch_ms(val: datetime) -> int:
+    """Convert a datetime into milliseconds since the epoch, how dates are sent to feature services."""
+    return int(pd.Timestamp(val).timestamp() * 1000)
+
+
+def gauge_feature(gauge, metrics: Union[str, Iterable] = 'cfs', low: float = None, high: float = None) -> dict:
+    """
+    Create a feature with the latest observation and status for a gauge, ready to publish.
+
+    Args:
+        gauge: ``river_levels.Gauge`` to retrieve the latest observation for.
+        metrics: Metric or list of metrics to include. The status is determined using the first metric, and is
+            'unknown' if there is no observation for it.
+        low: Optional
+            Value of the first metric below which the status is 'low'.
+        high: Optional
+            Value of the first metric above which the status is 'high'. Without either threshold the status is
+            'unknown', since whether a reading is runnable cannot be determined.
+
+    Returns: Feature dictionary with 'attributes' and, if the gauge location is known, 'geometry'.
+    """
+    metrics = normalize_metrics(metrics)
+
+    obs = gauge.get_observations(metrics=metrics)
+
+    attrs = {'gauge_id': gauge.id, 'source': gauge.source.upper(), 'observed': None, 'status': 'unknown'}
+
+    if len(obs.index):
+        latest = obs.iloc[-1]
+        attrs['observed'] = _to_epoch_ms(obs.index[-1])
+
+        for col in obs.columns:
+            val = latest[col]
+
+            # convert numpy scalars to python types so they serialize cleanly
+            if pd.isna(val):
+                val = None
+            elif hasattr(val, 'item'):
+                val = val.item()
+
+            attrs[col] = val
+
+        # classify using the first metric requested, only if there are thresholds to classify against
+        val = attrs.get(metrics[0])
+        if isinstance(val, (int, float)) and (low is not None or high is not None):
+            if low is not None and val < low:
+                attrs['status'] = 'low'
+            elif high is not None and val > high:
+                attrs['status'] = 'high'
+            else:
+                attrs['status'] = 'runnable'
+
+    feature = {'attributes': attrs}
+
+    if gauge.location is not None:
+        feature['geometry'] = gauge.location
+
+    return feature
+
+
+class FeatureLayerPublisher(object):
+    """
+    Upsert features into a hosted feature layer, only sending features changed since last published.
+
+    Args:
+        feature_layer: ``arcgis.features.FeatureLayer`` to publish to.
+        key_fields: Field, or list of fields, uniquely identifying each feature, such as the gauge id, or the gauge
+            id and timestamp for curves.
+        batch_size: Optional
+            Maximum number of features sent in each ``edit_features`` call. Default is the smaller of
+            ``DEFAULT_BATCH_SIZE`` and the maximum record count of the layer.
+        max_workers: Optional
+            Number of batches sent in parallel. Default is one.
+    """
+
+    def __init__(self, feature_layer, key_fields: Union[str, List[str]] = 'gauge_id', batch_size: int = None,
+                 max_workers: int = 1) -> None:
+        self.feature_layer = feature_layer
+        self.key_fields = [key_fields] if isinstance(key_fields, str) else list(key_fields)
+        self.max_workers = max_workers
+
+        if batch_size is None:
+            max_cnt = getattr(feature_layer.properties, 'maxRecordCount', None)
+            batch_size = DEFAULT_BATCH_SIZE if max_cnt is None else min(DEFAULT_BATCH_SIZE, max_cnt)
+        assert batch_size > 0, 'batch_size must be at least one.'
+        self.batch_size = batch_size
+
+        self.oid_field = getattr(feature_layer.properties, 'objectIdField', 'OBJECTID')
+
+        # last published state, keyed by the key field values, loaded from the layer on first publish
+        self._state = None
+
+    def _get_key(self, attributes: dict) -> tuple:
+        """Get the tuple of key field values for a feature."""
+        return tuple(attributes[fld] for fld in self.key_fields)
+
+    @staticmethod
+    def _normalize_geometry(geometry: dict) -> tuple:
+        """Reduce a point geometry to rounded coordinates for comparison."""
+        if geometry is None:
+            return None
+        return tuple(round(geometry[k], _coord_precision) for k in ('x', 'y') if k in geometry)
+
+    def load_state(self) -> None:
+        """Load the currently published features from the layer to diff against."""
+        fset = self.feature_layer.query(where='1=1', out_fields='*', return_geometry=True, out_sr=4326)
+
+        self._state = {}
+        for feature in fset.features:
+            attrs = dict(feature.attributes)
+            oid = attrs.pop(self.oid_field)
+            self._state[self._get_key(attrs)] = {
+                'oid': oid,
+                'attributes': attrs,
+                'geometry': self._normalize_geometry(feature.geometry)
+            }
+
+    def _is_changed(self, feature: dict, published: dict) -> bool:
+        """Determine if a feature differs from what was last published, only comparing the values being sent."""
+        attrs = feature['attributes']
+        if any(published['attributes'].get(k) != v for k, v in attrs.items()):
+            return True
+        geom = self._normalize_geometry(feature.get('geometry'))
+        return geom is not None and geom != published['geometry']
+
+    def _send_batch(self, adds: List[dict], updates: List[dict]) -> dict:
+        """Send one batch of edits to the feature layer."""
+        return self.feature_layer.edit_features(adds=adds if len(adds) else None,
+                                                updates=updates if len(updates) else None)
+
+    def publish(self, features: Iterable[dict]) -> dict:
+        """
+        Add new features and update changed features in the feature layer. New features without a geometry are
+        not added, and are reported as failures instead.
+
+        Args:
+            features: Feature dictionaries with 'attributes', including the key fields, and 'geometry', which is
+                optional for features already in the layer.
+
+        Returns: Dictionary with the counts of features 'added', 'updated' and 'unchanged', the number of
+            'batches' sent, and a list of 'failures' with the key and error for each feature not saved.
+        """
+        if self._state is None:
+            self.load_state()
+
+        adds, updates, unchanged, failures = [], [], 0, []
+
+        # deduplicate by key, keeping the last feature provided
+        feature_dict = {self._get_key(f['attributes']): f for f in features}
+
+        # sort into new, changed and unchanged features
+        for key, feature in feature_dict.items():
+            published = self._state.get(key)
+            if published is None and feature.get('geometry') is None:
+                failures.append({'key': key, 'error': 'New feature has no geometry.'})
+            elif published is None:
+                adds.append(feature)
+            elif self._is_changed(feature, published):
+                upd = {'attributes': {**feature['attributes'], self.oid_field: published['oid']}}
+                if 'geometry' in feature:
+                    upd['geometry'] = feature['geometry']
+                updates.append(upd)
+            else:
+                unchanged += 1
+
+        # chunk the edits into batches no larger than the batch size, filling each batch with adds then updates
+        edit_lst = [('add', f) for f in adds] + [('update', f) for f in updates]
+        batch_lst = [edit_lst[idx:idx + self.batch_size] for idx in range(0, len(edit_lst), self.batch_size)]
+
+        report = {'added': 0, 'updated': 0, 'unchanged': unchanged, 'batches': len(batch_lst), 'failures': failures}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_dict = {}
+            for batch in batch_lst:
+                batch_adds = [f for typ, f in batch if typ == 'add']
+                batch_updates = [f for typ, f in batch if typ == 'update']
+                future = executor.submit(self._send_batch, batch_adds, batch_updates)
+                future_dict[future] = (batch_adds, batch_updates)
+
+            for future in as_completed(future_dict):
+                batch_adds, batch_updates = future_dict[future]
+
+                try:
+                    res = future.result()
+                except Exception as e:
+                    for f in batch_adds + batch_updates:
+                        report['failures'].append({'key': self._get_key(f['attributes']),
+                                                   'error': f'{type(e).__name__}: {e}'})
+                    continue
+
+                # record what was saved so the next publish only sends changes
+                for typ, feature_lst, result_lst in (('added', batch_adds, res.get('addResults', [])),
+                                                     ('updated', batch_updates, res.get('updateResults', []))):
+                    for feature, result in zip(feature_lst, result_lst):
+                        attrs = dict(feature['attributes'])
+                        key = self._get_key(attrs)
+                        if result.get('success'):
+                            attrs.pop(self.oid_field, None)
+                            self._state[key] = {
+                                'oid': result.get('objectId'),
+                                'attributes': {**self._state.get(key, {}).get('attributes', {}), **attrs},
+                                'geometry': self._normalize_geometry(feature['geometry']) if 'geometry' in feature
+                                else self._state.get(key, {}).get('geometry')
+                            }
+                            report[typ] += 1
+                        else:
+                            report['failures'].append({'key': key, 'error': result.get('error')})
+
+        return report
@@ -4,6 +4,8 @@ __author__ = 'Joel McCune (https://github.com/knu2xs)'
 __license__ = 'Apache 2.0'
 __copyright__ = 'Copyright 2020 by Joel McCune (https://github.com/knu2xs)'
 
-__all__ = ['Gauge']
+__all__ = ['Gauge', 'ObservationBuffer', 'SiteCatalog']
 
+from .buffer import ObservationBuffer
 from .main import Gauge
+from .catalog import SiteCatalog
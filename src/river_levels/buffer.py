@@ -0,0 +1,201 @@
+"""
+Fixed capacity ring buffer of recent observations for a single metric.
+
+Storage is preallocated when the buffer is created, so memory per gauge is fixed regardless of how long a poller
+runs, and appends never copy existing observations. Each observation is written twice, at its slot and at its slot
+plus the capacity, so the most recent observations are always one contiguous slice of the storage. This enables
+windowed views without copying, only converting to a DataFrame when requested.
+"""
+from datetime import datetime
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['ObservationBuffer']
+
+
+def _to_ns(timestamp: Union[datetime, pd.Timestamp], tz: str) -> int:
+    """Nanoseconds since the epoch, assuming a naive timestamp is in the provided timezone."""
+    ts = pd.Timestamp(timestamp)
+    ts = ts.tz_localize(tz) if ts.tzinfo is None else ts
+    return ts.value
+
+
+class ObservationBuffer(object):
+    """
+    Ring buffer of the most recent observations for one metric, deduplicated by timestamp.
+
+    Args:
+        capacity: Number of observations retained. Once full, each append discards the oldest observation.
+        tz: Optional
+            Timezone name or tzinfo observations are reported in, and timezone naive timestamps are assumed to be
+            in. Default is UTC.
+    """
+
+    def __init__(self, capacity: int, tz: str = 'UTC') -> None:
+        assert capacity > 0, 'capacity must be at least one.'
+        self.capacity = int(capacity)
+        self.tz = tz
+
+        # mirrored storage, so the most recent observations are always contiguous
+        self._times = np.zeros(2 * self.capacity, dtype=np.int64)
+        self._values = np.full(2 * self.capacity, np.nan, dtype=np.float64)
+
+        # slot for the next observation and number of observations retained
+        self._head = 0
+        self._count = 0
+
+    @classmethod
+    def for_window(cls, window: str = '30D', frequency: str = '15min', tz: str = 'UTC') -> 'ObservationBuffer':
+        """
+        Create a buffer sized to retain a window of observations at a frequency.
+
+        Args:
+            window: Duration to retain, such as '30D'.
+            frequency: Expected interval between observations, such as '15min'.
+            tz: Timezone observations are reported in.
+
+        Returns: Buffer with capacity for the window.
+        """
+        return cls(int(pd.Timedelta(window) / pd.Timedelta(frequency)), tz)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes allocated for storage, fixed at creation."""
+        return self._times.nbytes + self._values.nbytes
+
+    @property
+    def _start(self) -> int:
+        """Index in storage of the oldest observation retained."""
+        return self._head + self.capacity - self._count
+
+    @property
+    def last_timestamp(self) -> pd.Timestamp:
+        """Timestamp of the most recent observation, or None if empty."""
+        if self._count == 0:
+            return None
+        return pd.Timestamp(int(self._times[self._head + self.capacity - 1]), tz='UTC').tz_convert(self.tz)
+
+    def _write(self, slot: int, time_ns: int, value: float) -> None:
+        """Write an observation into both the slot and the mirror of the slot."""
+        self._times[slot] = self._times[slot + self.capacity] = time_ns
+        self._values[slot] = self._values[slot + self.capacity] = value
+
+    def _replace(self, time_ns: int, value: float) -> bool:
+        """Replace the value of an observation already retained with the same timestamp, if there is one."""
+        times = self._times[self._start:self._head + self.capacity]
+        idx = int(np.searchsorted(times, time_ns))
+        if idx < len(times) and times[idx] == time_ns:
+            self._write((self._start + idx) % self.capacity, time_ns, value)
+            return True
+        return False
+
+    def append(self, timestamp: Union[datetime, pd.Timestamp], value: float) -> bool:
+        """
+        Append one observation. An observation with the same timestamp as one already retained replaces its value,
+        and an observation older than the most recent which is not already retained is ignored.
+
+        Args:
+            timestamp: Time of the observation.
+            value: Observed value.
+
+        Returns: True if the observation was added or replaced a value, False if ignored.
+        """
+        time_ns = _to_ns(timestamp, self.tz)
+        value = np.nan if value is None else float(value)
+
+        # observations at or before the most recent only replace existing values
+        if self._count and time_ns <= self._times[self._head + self.capacity - 1]:
+            return self._replace(time_ns, value)
+
+        self._write(self._head, time_ns, value)
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+        return True
+
+    def extend(self, timestamps, values) -> int:
+        """
+        Append many observations at once, with the same handling of repeated timestamps as ``append``.
+
+        Args:
+            timestamps: Array-like of observation times, such as a DatetimeIndex.
+            values: Array-like of observed values.
+
+        Returns: Number of observations added or replaced.
+        """
+        idx = pd.DatetimeIndex(timestamps)
+        idx = idx.tz_localize(self.tz) if idx.tz is None else idx
+        time_arr = idx.tz_convert('UTC').tz_localize(None).values.astype('datetime64[ns]').view(np.int64)
+        value_arr = np.asarray(pd.to_numeric(np.asarray(values, dtype=object), errors='coerce'), dtype=np.float64)
+
+        # sort and keep the last value provided for each timestamp
+        order = np.argsort(time_arr, kind='stable')
+        time_arr, value_arr = time_arr[order], value_arr[order]
+        keep = np.append(time_arr[1:] != time_arr[:-1], True) if len(time_arr) else np.array([], dtype=bool)
+        time_arr, value_arr = time_arr[keep], value_arr[keep]
+
+        # observations at or before the most recent only replace existing values
+        cnt = 0
+        if self._count:
+            last_ns = self._times[self._head + self.capacity - 1]
+            old_cnt = int(np.searchsorted(time_arr, last_ns, side='right'))
+            cnt += sum(self._replace(t, v) for t, v in zip(time_arr[:old_cnt], value_arr[:old_cnt]))
+            time_arr, value_arr = time_arr[old_cnt:], value_arr[old_cnt:]
+
+        # only the most recent observations that fit are retained
+        time_arr, value_arr = time_arr[-self.capacity:], value_arr[-self.capacity:]
+        new_cnt = len(time_arr)
+
+        # write in at most two contiguous chunks, wrapping around the end of the slots, plus the mirror
+        first = min(new_cnt, self.capacity - self._head)
+        for dst, src in ((self._head, slice(0, first)), (0, slice(first, new_cnt))):
+            chunk = len(time_arr[src])
+            if chunk:
+                self._times[dst:dst + chunk] = self._times[dst + self.capacity:dst + self.capacity + chunk] = \
+                    time_arr[src]
+                self._values[dst:dst + chunk] = self._values[dst + self.capacity:dst + self.capacity + chunk] = \
+                    value_arr[src]
+
+        self._head = (self._head + new_cnt) % self.capacity
+        self._count = min(self._count + new_cnt, self.capacity)
+
+        return cnt + new_cnt
+
+    def view(self, start_date: Union[datetime, pd.Timestamp] = None,
+             end_date: Union[datetime, pd.Timestamp] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get read-only views, without copying, of the observations retained in a temporal window.
+
+        Args:
+            start_date: Optional
+                Only include observations at or after this time.
+            end_date: Optional
+                Only include observations at or before this time.
+
+        Returns: Tuple of arrays of timestamps, as nanoseconds since the epoch in UTC, and values, oldest first.
+        """
+        lo, hi = self._start, self._head + self.capacity
+        times = self._times[lo:hi]
+
+        if start_date is not None:
+            lo += int(np.searchsorted(times, _to_ns(start_date, self.tz), side='left'))
+        if end_date is not None:
+            hi = self._start + int(np.searchsorted(times, _to_ns(end_date, self.tz), side='right'))
+
+        time_view, value_view = self._times[lo:max(lo, hi)], self._values[lo:max(lo, hi)]
+        time_view.flags.writeable = False
+        value_view.flags.writeable = False
+
+        return time_view, value_view
+
+    def to_series(self, start_date: Union[datetime, pd.Timestamp] = None,
+                  end_date: Union[datetime, pd.Timestamp] = None, name: str = None) -> pd.Series:
+        """Copy the observations in a temporal window into a Pandas Series indexed by timezone aware timestamp."""
+        time_view, value_view = self.view(start_date, end_date)
+        idx = pd.DatetimeIndex(time_view.astype('datetime64[ns]')).tz_localize('UTC').tz_convert(self.tz)
+        return pd.Series(value_view.copy(), index=idx, name=name)
@@ -0,0 +1,458 @@
+"""
+Locally cached catalog of gauge sites with a spatial index for finding gauges near a location or within an area.
+
+Example:
+
+    >>> from river_levels.catalog import SiteCatalog
+    >>> catalog = SiteCatalog.load()
+    >>> catalog.refresh(state_codes='wa')
+    >>> gauges = catalog.nearest(-120.65, 47.48, count=5, metrics='cfs')
+    >>> obs = gauges[0].get_observations(period='week')
+"""
+import importlib.util
+import io
+import json
+from pathlib import Path
+from typing import Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import requests
+
+from .main import Gauge
+from .sources import UsgsAdapter, _get_cache_dir, normalize_metrics
+
+# see if arcpy available to accommodate non-windows environments
+if importlib.util.find_spec('arcpy') is not None:
+    import arcpy
+
+    has_arcpy = True
+else:
+    has_arcpy = False
+
+__all__ = ['SiteCatalog']
+
+# mean radius of the earth in kilometers for great circle distances
+_earth_radius_km = 6371.0088
+
+# columns saved in the catalog
+_catalog_columns = ['site_id', 'source', 'name', 'longitude', 'latitude', 'drainage_area', 'parameter_codes']
+
+
+def _read_rdb(text: str) -> pd.DataFrame:
+    """Read the tab delimited RDB format returned by USGS water services into a DataFrame of strings."""
+    # skip the comment header, not using the comment parameter since station names can include a hash
+    data_txt = '\n'.join(line for line in text.splitlines() if not line.startswith('#'))
+    df = pd.read_csv(io.StringIO(data_txt), sep='\t', dtype=str, keep_default_na=False, na_values=[''])
+
+    # the first row after the header describes the column widths and types
+    return df.iloc[1:].reset_index(drop=True)
+
+
+def _haversine_km(lon: float, lat: float, lon_arr: np.ndarray, lat_arr: np.ndarray) -> np.ndarray:
+    """Great circle distances in kilometers from a point to arrays of points."""
+    lon, lat, lon_arr, lat_arr = map(np.radians, (lon, lat, lon_arr, lat_arr))
+    a = np.sin((lat_arr - lat) / 2) ** 2 + np.cos(lat) * np.cos(lat_arr) * np.sin((lon_arr - lon) / 2) ** 2
+    return 2 * _earth_radius_km * np.arcsin(np.sqrt(a))
+
+
+def _points_in_rings(x: np.ndarray, y: np.ndarray, rings: List[np.ndarray]) -> np.ndarray:
+    """
+    Test which points are inside the rings of one polygon using the even-odd rule, so holes and multiple parts
+    defined as rings, as in Esri JSON, are handled.
+    """
+    inside = np.zeros(len(x), dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:-1, 0], ring[:-1, 1]
+        x2, y2 = ring[1:, 0], ring[1:, 1]
+
+        # cast a ray to the right of each point, flipping for every edge crossed
+        for ex1, ey1, ex2, ey2 in zip(x1, y1, x2, y2):
+            if ey1 == ey2:
+                continue
+            crosses = ((ey1 > y) != (ey2 > y)) & (x < (ex2 - ex1) * (y - ey1) / (ey2 - ey1) + ex1)
+            inside ^= crosses
+    return inside
+
+
+def _points_in_polygons(x: np.ndarray, y: np.ndarray, polygons: List[List[np.ndarray]]) -> np.ndarray:
+    """
+    Test which points are inside any of the polygons, each a list of rings, so overlapping polygons, such as
+    overlapping parts of a GeoJSON MultiPolygon or overlapping features, do not cancel each other out.
+    """
+    inside = np.zeros(len(x), dtype=bool)
+    for rings in polygons:
+        inside |= _points_in_rings(x, y, rings)
+    return inside
+
+
+def _web_mercator_to_geographic(ring: np.ndarray) -> np.ndarray:
+    """Convert Web Mercator coordinates into longitude and latitude."""
+    lon = np.degrees(ring[:, 0] / 6378137.0)
+    lat = np.degrees(2 * np.arctan(np.exp(ring[:, 1] / 6378137.0)) - np.pi / 2)
+    return np.column_stack([lon, lat])
+
+
+def _get_polygons(aoi) -> List[List[np.ndarray]]:
+    """
+    Get polygons, each a list of rings as arrays of longitude and latitude coordinates, from an area of interest.
+    Rings are grouped by feature, or for GeoJSON by polygon, since only rings within a group define holes.
+
+    The area of interest can be Esri JSON polygon, such as an ``arcgis.geometry.Polygon``, a GeoJSON polygon or
+    multipolygon, anything with a ``__geo_interface__``, or, if arcpy is available, an ``arcpy.Polygon``, feature
+    layer or feature class, the same inputs as ``ck_tools.create_aoi_mask_layer``.
+    """
+    # arcpy geometries, layers and feature classes are projected to geographic and read as Esri JSON
+    if has_arcpy and isinstance(aoi, arcpy.Geometry):
+        aoi = json.loads(aoi.projectAs(arcpy.SpatialReference(4326)).JSON)
+
+    elif has_arcpy and not isinstance(aoi, dict) and not hasattr(aoi, '__geo_interface__'):
+        aoi = str(aoi) if isinstance(aoi, Path) else aoi
+        assert arcpy.Describe(aoi).shapeType == 'Polygon', 'The area of interest must be a polygon.'
+        polys = []
+        with arcpy.da.SearchCursor(aoi, ['SHAPE@JSON'], spatial_reference=arcpy.SpatialReference(4326)) as cur:
+            for (geom_json,) in cur:
+                polys.append([np.array(r, dtype=float)[:, :2] for r in json.loads(geom_json)['rings']])
+        return polys
+
+    # anything else supporting the geo interface, such as shapely geometries, is handled as GeoJSON
+    if not isinstance(aoi, dict) and hasattr(aoi, '__geo_interface__'):
+        aoi = aoi.__geo_interface__
+
+    assert isinstance(aoi, dict), 'The area of interest must be a polygon as Esri JSON, GeoJSON or, if arcpy is ' \
+                                  'available, an arcpy Polygon, feature layer or feature class.'
+
+    # Esri JSON
+    if 'rings' in aoi:
+        rings = [np.array(r, dtype=float)[:, :2] for r in aoi['rings']]
+        wkid = aoi.get('spatialReference', {}).get('latestWkid', aoi.get('spatialReference', {}).get('wkid', 4326))
+        assert wkid in [4326, 3857, 102100], 'Esri JSON areas of interest must be in WGS84 (4326) or Web ' \
+                                             'Mercator (3857).'
+        if wkid != 4326:
+            rings = [_web_mercator_to_geographic(r) for r in rings]
+        return [rings]
+
+    # GeoJSON
+    geom = aoi.get('geometry', aoi) if aoi.get('type') == 'Feature' else aoi
+    assert geom.get('type') in ['Polygon', 'MultiPolygon'], 'The area of interest must be a polygon.'
+    polys = [geom['coordinates']] if geom['type'] == 'Polygon' else geom['coordinates']
+    return [[np.array(r, dtype=float)[:, :2] for r in poly] for poly in polys]
+
+
+class SiteCatalog(object):
+    """
+    Catalog of gauge sites with coordinates, drainage area and available parameter codes, indexed with a regular
+    grid for fast nearest, bounding box and polygon queries.
+
+    Args:
+        sites: Optional
+            Pandas DataFrame of sites with the columns site_id, source, name, longitude, latitude, drainage_area
+            and parameter_codes, a comma separated string of parameter codes.
+        cache_path: Optional
+            CSV file the catalog is saved to. Default is in the river_levels cache directory.
+        cell_size: Optional
+            Size of the grid index cells in decimal degrees. Default is 0.5.
+    """
+
+    url = 'https://waterservices.usgs.gov/nwis/site/'
+
+    def __init__(self, sites: pd.DataFrame = None, cache_path: Path = None, cell_size: float = 0.5) -> None:
+        self.cache_path = _get_cache_dir() / 'catalog' / 'usgs_sites.csv' if cache_path is None \
+            else Path(cache_path)
+        self.cell_size = cell_size
+        self.sites = pd.DataFrame(columns=_catalog_columns) if sites is None else sites
+        self._build_index()
+
+    def __len__(self) -> int:
+        return len(self.sites.index)
+
+    @classmethod
+    def load(cls, cache_path: Path = None, cell_size: float = 0.5) -> 'SiteCatalog':
+        """Load the catalog previously saved to the cache, or an empty catalog if nothing is cached yet."""
+        catalog = cls(cache_path=cache_path, cell_size=cell_size)
+        if catalog.cache_path.exists():
+            sites = pd.read_csv(catalog.cache_path, dtype={'site_id': str, 'parameter_codes': str})
+            sites['parameter_codes'] = sites['parameter_codes'].fillna('')
+            catalog.sites = sites
+            catalog._build_index()
+        return catalog
+
+    def save(self) -> Path:
+        """Save the catalog to the cache."""
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.sites.to_csv(self.cache_path, index=False)
+        return self.cache_path
+
+    def _build_index(self) -> None:
+        """Build the grid index of row positions for each cell, along with coordinate arrays for vectorized math."""
+        self._lon = self.sites['longitude'].to_numpy(dtype=float)
+        self._lat = self.sites['latitude'].to_numpy(dtype=float)
+
+        col = np.floor(self._lon / self.cell_size).astype(np.int64)
+        row = np.floor(self._lat / self.cell_size).astype(np.int64)
+
+        # group the row positions by cell with a single sort
+        self._grid = {}
+        if len(col):
+            order = np.lexsort((row, col))
+            cells = np.column_stack([col[order], row[order]])
+            brk_lst = np.flatnonzero(np.any(np.diff(cells, axis=0) != 0, axis=1)) + 1
+            for idx_arr in np.split(order, brk_lst):
+                self._grid[(int(col[idx_arr[0]]), int(row[idx_arr[0]]))] = idx_arr
+
+            self._col_rng = (int(col.min()), int(col.max()))
+            self._row_rng = (int(row.min()), int(row.max()))
+
+    def refresh(self, state_codes: Union[str, Iterable] = None, bbox: Tuple[float, float, float, float] = None,
+                site_ids: Union[str, Iterable] = None, save: bool = True) -> 'SiteCatalog':
+        """
+        Retrieve active stream sites with instantaneous values from the USGS site service, adding them to the
+        catalog or replacing sites already in the catalog.
+
+        Args:
+            state_codes: Optional
+                Two letter state code, or list of state codes, to retrieve sites for.
+            bbox: Optional
+                Bounding box of (west, south, east, north) decimal degrees to retrieve sites for. The USGS limits
+                the product of the width and height to 25 degrees.
+            site_ids: Optional
+                Site ID, or list of site IDs, to retrieve.
+            save: Optional
+                Save the catalog to the cache when finished. Default is True.
+
+        Returns: The catalog, refreshed.
+        """
+        assert state_codes is not None or bbox is not None or site_ids is not None, \
+            'Either state_codes, a bbox or site_ids must be provided.'
+
+        # build the list of major filters, since the site service only accepts one state at a time
+        state_codes = [state_codes] if isinstance(state_codes, str) else state_codes
+        filter_lst = [{'stateCd': st.lower()} for st in state_codes] if state_codes is not None else []
+        if bbox is not None:
+            filter_lst.append({'bBox': ','.join(f'{v:.6f}' for v in bbox)})
+        if site_ids is not None:
+            site_ids = [site_ids] if isinstance(site_ids, str) else list(site_ids)
+            filter_lst.append({'sites': ','.join(site_ids)})
+
+        site_lst = [self._retrieve_sites(flt) for flt in filter_lst]
+
+        # replace any existing sites with the freshly retrieved ones, leaving out empty frames so they do not turn
+        # the coordinate columns into objects
+        frame_lst = [df for df in [self.sites] + site_lst if len(df.index)]
+        if len(frame_lst):
+            sites = pd.concat(frame_lst, ignore_index=True)
+            self.sites = sites.drop_duplicates(subset=['source', 'site_id'], keep='last').reset_index(drop=True)
+            self._build_index()
+
+        if save:
+            self.save()
+
+        return self
+
+    def _retrieve_sites(self, major_filter: dict) -> pd.DataFrame:
+        """Retrieve sites for one major filter, combining the expanded site output with the series catalog."""
+        params = {'format': 'rdb', 'siteType': 'ST', 'siteStatus': 'active', 'hasDataTypeCd': 'iv', **major_filter}
+
+        # site descriptions including drainage area, where not found means no sites match the filter
+        res = requests.get(self.url, params={**params, 'siteOutput': 'expanded'})
+        if res.status_code == 404:
+            return pd.DataFrame(columns=_catalog_columns)
+        assert res.status_code == 200, f'Failed to retrieve sites for {major_filter}, status {res.status_code}.'
+        site_df = _read_rdb(res.text)
+
+        # parameters available at each site
+        res = requests.get(self.url, params={**params, 'seriesCatalogOutput': 'true', 'outputDataTypeCd': 'iv'})
+        assert res.status_code == 200, f'Failed to retrieve parameters for {major_filter}, status {res.status_code}.'
+        series_df = _read_rdb(res.text)
+        parm_srs = series_df.groupby('site_no')['parm_cd'].agg(lambda p: ','.join(sorted(set(p.dropna()))))
+
+        sites = pd.DataFrame({
+            'site_id': site_df['site_no'],
+            'source': 'USGS',
+            'name': site_df['station_nm'],
+            'longitude': pd.to_numeric(site_df['dec_long_va'], errors='coerce'),
+            'latitude': pd.to_numeric(site_df['dec_lat_va'], errors='coerce'),
+            'drainage_area': pd.to_numeric(site_df['drain_area_va'], errors='coerce'),
+            'parameter_codes': site_df['site_no'].map(parm_srs).fillna('')
+        })
+
+        # sites without coordinates cannot be indexed
+        return sites.dropna(subset=['longitude', 'latitude'])[_catalog_columns]
+
+    def _candidates_bbox(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """Row positions of sites in grid cells overlapping a bounding box."""
+        if len(self._grid) == 0:
+            return np.array([], dtype=np.int64)
+
+        col_min = max(int(np.floor(west / self.cell_size)), self._col_rng[0])
+        col_max = min(int(np.floor(east / self.cell_size)), self._col_rng[1])
+        row_min = max(int(np.floor(south / self.cell_size)), self._row_rng[0])
+        row_max = min(int(np.floor(north / self.cell_size)), self._row_rng[1])
+
+        idx_lst = [self._grid[(c, r)] for c in range(col_min, col_max + 1) for r in range(row_min, row_max + 1)
+                   if (c, r) in self._grid]
+
+        return np.concatenate(idx_lst) if len(idx_lst) else np.array([], dtype=np.int64)
+
+    def _filter_metrics(self, idx_arr: np.ndarray, metrics: Union[str, Iterable]) -> np.ndarray:
+        """Only keep sites recording all the metrics."""
+        if metrics is None or len(idx_arr) == 0:
+            return idx_arr
+        code_srs = self.sites['parameter_codes'].iloc[idx_arr]
+        keep = np.ones(len(idx_arr), dtype=bool)
+        for metric in normalize_metrics(metrics):
+            keep &= code_srs.str.contains(UsgsAdapter.metric_codes[metric], regex=False).to_numpy()
+        return idx_arr[keep]
+
+    def _to_gauges(self, idx_arr: np.ndarray) -> List[Gauge]:
+        """Create gauges with the location populated for the row positions."""
+        gauge_lst = []
+        for site in self.sites.iloc[idx_arr].itertuples():
+            gauge = Gauge(site.site_id, site.source)
+            gauge.location = {'x': float(site.longitude), 'y': float(site.latitude),
+                              'spatialReference': {'wkid': 4326}}
+            gauge_lst.append(gauge)
+        return gauge_lst
+
+    def _within_bbox(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """Row positions of sites within a bounding box, sorted."""
+        idx_arr = self._candidates_bbox(west, south, east, north)
+        keep = (self._lon[idx_arr] >= west) & (self._lon[idx_arr] <= east) & \
+               (self._lat[idx_arr] >= south) & (self._lat[idx_arr] <= north)
+        return np.sort(idx_arr[keep])
+
+    def bbox(self, west: float, south: float, east: float, north: float,
+             metrics: Union[str, Iterable] = None) -> List[Gauge]:
+        """
+        Get gauges within a bounding box.
+
+        Args:
+            west: Minimum longitude.
+            south: Minimum latitude.
+            east: Maximum longitude.
+            north: Maximum latitude.
+            metrics: Optional
+                Only return gauges recording these metrics, cfs (or flow), height or temperature.
+
+        Returns: List of gauges with the location populated.
+        """
+        return self._to_gauges(self._filter_metrics(self._within_bbox(west, south, east, north), metrics))
+
+    def nearest(self, longitude: float, latitude: float, count: int = 1, max_distance: float = None,
+                metrics: Union[str, Iterable] = None) -> List[Gauge]:
+        """
+        Get the gauges nearest to a location.
+
+        Args:
+            longitude: Longitude of the location in decimal degrees.
+            latitude: Latitude of the location in decimal degrees.
+            count: Optional
+                Number of gauges to return. Default is one.
+            max_distance: Optional
+                Only return gauges within this many kilometers.
+            metrics: Optional
+                Only return gauges recording these metrics, cfs (or flow), height or temperature.
+
+        Returns: List of gauges with the location populated, sorted by distance.
+        """
+        if len(self._grid) == 0:
+            return []
+
+        col = int(np.floor(longitude / self.cell_size))
+        row = int(np.floor(latitude / self.cell_size))
+        max_ring = max(abs(col - self._col_rng[0]), abs(col - self._col_rng[1]),
+                       abs(row - self._row_rng[0]), abs(row - self._row_rng[1]))
+
+        # expand rings of cells around the location until enough candidates are found
+        idx_arr = np.array([], dtype=np.int64)
+        for ring in range(max_ring + 1):
+            idx_arr = self._filter_metrics(self._candidates_bbox(
+                (col - ring) * self.cell_size, (row - ring) * self.cell_size,
+                (col + ring) * self.cell_size, (row + ring) * self.cell_size), metrics)
+            if len(idx_arr) >= count:
+                break
+
+        if len(idx_arr) == 0:
+            return []
+
+        # a site in an unsearched cell may still be closer than the farthest candidate, so search a bounding box
+        # covering the distance to the farthest candidate needed
+        dist_arr = _haversine_km(longitude, latitude, self._lon[idx_arr], self._lat[idx_arr])
+        radius = np.sort(dist_arr)[min(count, len(dist_arr)) - 1]
+        if max_distance is not None:
+            radius = min(radius, max_distance)
+        lat_deg = np.degrees(radius / _earth_radius_km)
+        lon_deg = 180.0 if abs(latitude) + lat_deg >= 90 else lat_deg / np.cos(np.radians(abs(latitude) + lat_deg))
+        idx_arr = self._filter_metrics(self._within_bbox(longitude - lon_deg, latitude - lat_deg,
+                                                         longitude + lon_deg, latitude + lat_deg), metrics)
+
+        # sort by distance, keeping the nearest
+        dist_arr = _haversine_km(longitude, latitude, self._lon[idx_arr], self._lat[idx_arr])
+        order = np.argsort(dist_arr, kind='stable')
+        if max_distance is not None:
+            order = order[dist_arr[order] <= max_distance]
+
+        return self._to_gauges(idx_arr[order[:count]])
+
+    def within(self, aoi, metrics: Union[str, Iterable] = None) -> List[Gauge]:
+        """
+        Get gauges within an area of interest polygon.
+
+        Args:
+            aoi: Area of interest polygon as Esri JSON, such as an ``arcgis.geometry.Polygon``, GeoJSON, or, if arcpy
+                is available, an ``arcpy.Polygon``, feature layer or feature class, the same area of interest used
+                with ``ck_tools.create_aoi_mask_layer``.
+            metrics: Optional
+                Only return gauges recording these metrics, cfs (or flow), height or temperature.
+
+        Returns: List of gauges with the location populated.
+        """
+        polys = [rings for rings in _get_polygons(aoi) if len(rings)]
+        if len(polys) == 0:
+            return []
+
+        # narrow down using the extent of the polygons, and then test the candidates against the polygons
+        coords = np.concatenate([r for rings in polys for r in rings])
+        idx_arr = self._within_bbox(coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max())
+        idx_arr = self._filter_metrics(idx_arr, metrics)
+        idx_arr = idx_arr[_points_in_polygons(self._lon[idx_arr], self._lat[idx_arr], polys)]
+
+        return self._to_gauges(idx_arr)
+
+    def locate(self, gauge_ids: Union[str, Iterable], source: str = 'USGS', refresh: bool = True) -> List[Gauge]:
+        """
+        Get gauges by ID with the location populated from the catalog.
+
+        Args:
+            gauge_ids: Gauge ID, or list of gauge IDs.
+            source: Optional
+                Source for the gauges. Default is USGS.
+            refresh: Optional
+                Retrieve USGS sites not yet in the catalog from the site service, saving the catalog. Default is
+                True.
+
+        Returns: List of gauges in the same order as the IDs, with the location left as None for any gauges not
+            found in the catalog.
+        """
+        gauge_ids = [gauge_ids] if isinstance(gauge_ids, str) else list(gauge_ids)
+        source = source.upper()
+
+        # look up the row position of each site in the catalog
+        def _get_positions():
+            pos_arr = np.flatnonzero((self.sites['source'] == source).to_numpy())
+            return dict(zip(self.sites['site_id'].iloc[pos_arr], pos_arr))
+
+        pos_dict = _get_positions()
+        missing = [gid for gid in gauge_ids if gid not in pos_dict]
+        if refresh and source == 'USGS' and len(missing):
+            self.refresh(site_ids=missing)
+            pos_dict = _get_positions()
+
+        gauge_lst = []
+        for gauge_id in gauge_ids:
+            if gauge_id in pos_dict:
+                gauge_lst.extend(self._to_gauges(np.array([pos_dict[gauge_id]])))
+            else:
+                gauge_lst.append(Gauge(gauge_id, source))
+
+        return gauge_lst
@@ -0,0 +1,304 @@
+"""
+Command line interface for bulk retrieval and export of gauge observations.
+
+Example:
+
+    > river-levels gauges.txt --metrics cfs temperature --period week --workers 8 --output-dir ./data/raw
+
+The gauge list file contains one gauge per line, optionally followed by a comma and the source. Blank lines and
+lines starting with ``#`` are ignored.
+
+Progress is recorded in a run manifest in the output directory along with the request parameters and when the run
+started. If a run is interrupted, or some gauges fail or return no observations, running the same command again
+within the resume window, one hour by default, resumes the run, only retrieving gauges not yet completed. Otherwise,
+such as the next scheduled refresh, or once every gauge is completed, or with different parameters, a new run
+retrieves everything again, so a gauge which keeps failing never holds back refreshing the others.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import sys
+import time
+from typing import List, Tuple
+
+import pandas as pd
+
+from .main import Gauge
+from .sources import normalize_metrics
+
+__all__ = ['main', 'read_gauge_list', 'export_gauge']
+
+# name of the file in the output directory recording the parameters and progress of the run
+MANIFEST_FILE = '.river-levels-run.json'
+
+# file extension for each of the supported output formats
+output_formats = {
+    'parquet': 'parquet',
+    'csv': 'csv',
+    'ndjson': 'ndjson'
+}
+
+
+def read_gauge_list(gauge_file: Path, default_source: str = 'USGS') -> List[Tuple[str, str]]:
+    """
+    Read a gauge list file into a list of (gauge_id, source) tuples.
+
+    Args:
+        gauge_file: Path to the text file listing one gauge per line as either ``gauge_id`` or
+            ``gauge_id,source``.
+        default_source: Source used for lines not explicitly specifying one.
+
+    Returns: List of (gauge_id, source) tuples with duplicates removed, in file order.
+    """
+    gauge_lst = []
+
+    with open(gauge_file, 'r') as gauge_txt:
+        for line in gauge_txt:
+
+            # skip blank lines and comments
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+
+            # split out the source if provided
+            parts = [p.strip() for p in line.split(',')]
+            gauge_id = parts[0]
+            source = parts[1].upper() if len(parts) > 1 and len(parts[1]) else default_source.upper()
+
+            assert source in Gauge.sources.keys(), f'Invalid source, {source}, for gauge {gauge_id}. Source must ' \
+                                                   f'be one of [{",".join(Gauge.sources.keys())}].'
+
+            if (gauge_id, source) not in gauge_lst:
+                gauge_lst.append((gauge_id, source))
+
+    return gauge_lst
+
+
+def _write_dataframe(df: pd.DataFrame, output_path: Path, output_format: str) -> None:
+    """Helper to write a dataframe to a file in the requested format."""
+    df = df.copy()
+    df.index.name = 'timestamp'
+
+    if output_format == 'parquet':
+        df.to_parquet(output_path)
+    elif output_format == 'csv':
+        df.to_csv(output_path)
+    elif output_format == 'ndjson':
+        df.reset_index().to_json(output_path, orient='records', lines=True, date_format='iso')
+
+
+def _get_output_path(gauge_id: str, source: str, output_dir: Path, output_format: str) -> Path:
+    """Path to the output file for a gauge."""
+    return Path(output_dir) / f'{source.lower()}_{gauge_id}.{output_formats[output_format]}'
+
+
+def export_gauge(gauge_id: str, source: str, output_dir: Path, output_format: str = 'parquet', **kwargs) -> dict:
+    """
+    Retrieve observations for a single gauge and save them to the output directory.
+
+    Args:
+        gauge_id: Gauge ID to be retrieved.
+        source: Source for the gauge, one of the keys in ``Gauge.sources``.
+        output_dir: Directory where the output file will be saved.
+        output_format: Output file format, parquet, csv or ndjson.
+        **kwargs: Temporal and metric parameters passed through to ``Gauge.get_observations``.
+
+    Returns: Dictionary summarizing the export with the gauge, status, rows, bytes and seconds elapsed. The status
+        is 'completed' if observations were saved, 'empty' if no observations were returned, in which case any
+        previous output for the gauge is removed so it is not mistaken for current data, or 'failed'.
+    """
+    assert output_format in output_formats.keys(), f'output_format must be one of ' \
+                                                   f'[{",".join(output_formats.keys())}], not {output_format}'
+
+    output_path = _get_output_path(gauge_id, source, output_dir, output_format)
+
+    smry = {'gauge_id': gauge_id, 'source': source, 'path': str(output_path)}
+
+    strt = time.perf_counter()
+
+    try:
+        df = Gauge(gauge_id, source).get_observations(return_dataframe=True, **kwargs)
+
+        if len(df.index) == 0:
+            if output_path.exists():
+                output_path.unlink()
+            smry.update({'status': 'empty', 'rows': 0, 'bytes': 0})
+
+        else:
+
+            # write to a partial file first so an interrupted write is never mistaken for a completed export
+            part_path = output_path.with_name(f'{output_path.name}.part')
+            _write_dataframe(df, part_path, output_format)
+            os.replace(part_path, output_path)
+
+            smry.update({'status': 'completed', 'rows': len(df.index), 'bytes': output_path.stat().st_size})
+
+    except Exception as e:
+        smry.update({'status': 'failed', 'rows': None, 'bytes': 0, 'error': f'{type(e).__name__}: {e}'})
+
+    smry['seconds'] = round(time.perf_counter() - strt, 3)
+
+    return smry
+
+
+def _load_manifest(manifest_path: Path) -> dict:
+    """Load the run manifest, or None if there is not one or it cannot be read."""
+    try:
+        return json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(manifest: dict, manifest_path: Path) -> None:
+    """Save the run manifest, replacing the previous one in a single step."""
+    part_path = manifest_path.with_name(f'{manifest_path.name}.part')
+    part_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(part_path, manifest_path)
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    """Build the argument parser for the command line interface."""
+    parser = argparse.ArgumentParser(prog='river-levels',
+                                     description='Retrieve observations for a list of gauges and export to files.')
+
+    parser.add_argument('gauge_file', type=Path, help='Text file listing one gauge per line, as gauge_id or '
+                                                      'gauge_id,source.')
+    parser.add_argument('-m', '--metrics', nargs='+', default=['cfs'],
+                        help='Metrics to retrieve, cfs (or flow), height or temperature. Default is cfs.')
+    parser.add_argument('-s', '--source', default='USGS', choices=list(Gauge.sources.keys()),
+                        help='Source for gauges not explicitly specifying one in the gauge file. Default is USGS.')
+    parser.add_argument('--period', choices=['day', 'week', 'month', 'year'],
+                        help='Period to look back from now when retrieving observations.')
+    parser.add_argument('--period-count', type=int, help='Count of periods to look back. Default is one.')
+    parser.add_argument('--start-date', type=datetime.fromisoformat,
+                        help='ISO 8601 start date for a specific temporal window.')
+    parser.add_argument('--end-date', type=datetime.fromisoformat,
+                        help='ISO 8601 end date for a specific temporal window.')
+    parser.add_argument('--align-tolerance',
+                        help='Align metrics onto the timestamps of the first metric using the nearest observation '
+                             'within this tolerance, such as 5min.')
+    parser.add_argument('-o', '--output-dir', type=Path, default=Path.cwd(),
+                        help='Directory to save output files. Default is the current directory.')
+    parser.add_argument('-f', '--format', dest='output_format', default='parquet',
+                        choices=list(output_formats.keys()), help='Output file format. Default is parquet.')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='Number of gauges to retrieve in parallel. Default is four.')
+    parser.add_argument('--resume-within', type=pd.Timedelta, default='1h',
+                        help='Resume the last run with the same parameters if it did not finish and started within '
+                             'this long ago, such as 30min. Default is 1h.')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Start a new run, even if the last run with the same parameters did not finish.')
+
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Run the command line interface, printing a JSON summary of the run to standard output.
+
+    Args:
+        argv: Command line arguments. Default is to use ``sys.argv``.
+
+    Returns: Exit code, zero if no gauges failed and one if any failed.
+    """
+    args = _get_parser().parse_args(argv)
+
+    assert args.workers > 0, 'workers must be at least one.'
+
+    # parquet output relies on an optional dependency, so check before retrieving anything
+    if args.output_format == 'parquet':
+        try:
+            pd.io.parquet.get_engine('auto')
+        except ImportError as e:
+            sys.exit(f'river-levels: {e}')
+
+    gauge_lst = read_gauge_list(args.gauge_file, args.source)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    obs_kwargs = {
+        'metrics': normalize_metrics(args.metrics),
+        'period': args.period,
+        'period_count': args.period_count,
+        'start_date': args.start_date,
+        'end_date': args.end_date,
+        'align_tolerance': args.align_tolerance
+    }
+
+    # parameters identifying the run, so a run is only resumed with exactly the same request
+    params = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in obs_kwargs.items()}
+    params['output_format'] = args.output_format
+
+    # resume the last run if it has the same parameters, did not finish and started recently, otherwise start a new
+    # run, so results from an old run are never carried forward by a gauge which keeps failing
+    now = datetime.now(timezone.utc)
+    manifest_path = args.output_dir / MANIFEST_FILE
+    manifest = _load_manifest(manifest_path)
+    resumed = not args.overwrite and manifest is not None and manifest.get('parameters') == params and \
+        not manifest.get('finished', True) and 'started' in manifest and \
+        now - datetime.fromisoformat(manifest['started']) <= args.resume_within
+    if not resumed:
+        manifest = {'parameters': params, 'started': now.isoformat(), 'finished': False, 'gauges': {}}
+        _save_manifest(manifest, manifest_path)
+
+    strt = time.perf_counter()
+
+    # gauges completed earlier in a resumed run are skipped
+    result_lst, todo_lst = [], []
+    for gauge_id, source in gauge_lst:
+        output_path = _get_output_path(gauge_id, source, args.output_dir, args.output_format)
+        prev = manifest['gauges'].get(f'{source}:{gauge_id}', {})
+        if prev.get('status') == 'completed' and output_path.exists():
+            result_lst.append({'gauge_id': gauge_id, 'source': source, 'path': str(output_path),
+                               'status': 'skipped', 'rows': prev.get('rows'), 'bytes': output_path.stat().st_size,
+                               'seconds': 0.0})
+        else:
+            todo_lst.append((gauge_id, source))
+
+    # retrieve gauges in parallel since nearly all the time is spent waiting on the network
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(export_gauge, gauge_id, source, args.output_dir, args.output_format,
+                                   **obs_kwargs) for gauge_id, source in todo_lst]
+
+        # record progress as each gauge finishes so an interrupted run can be resumed
+        for future in as_completed(futures):
+            res = future.result()
+            manifest['gauges'][f'{res["source"]}:{res["gauge_id"]}'] = {'status': res['status'], 'rows': res['rows']}
+            _save_manifest(manifest, manifest_path)
+            result_lst.append(res)
+
+    # keep results in the same order as the gauge file
+    order = {(gauge_id, source): idx for idx, (gauge_id, source) in enumerate(gauge_lst)}
+    result_lst = sorted(result_lst, key=lambda r: order[(r['gauge_id'], r['source'])])
+
+    # the run is finished once every gauge is completed, so the next run starts over
+    manifest['finished'] = all(r['status'] in ['completed', 'skipped'] for r in result_lst)
+    _save_manifest(manifest, manifest_path)
+
+    failed_lst = [r for r in result_lst if r['status'] == 'failed']
+
+    smry = {
+        'gauges': len(result_lst),
+        'resumed': resumed,
+        'finished': manifest['finished'],
+        'completed': len([r for r in result_lst if r['status'] == 'completed']),
+        'skipped': len([r for r in result_lst if r['status'] == 'skipped']),
+        'empty': len([r for r in result_lst if r['status'] == 'empty']),
+        'failed': len(failed_lst),
+        'workers': args.workers,
+        'seconds': round(time.perf_counter() - strt, 3),
+        'bytes': sum(r['bytes'] for r in result_lst if r['status'] == 'completed'),
+        'failures': [{'gauge_id': r['gauge_id'], 'source': r['source'], 'error': r['error']} for r in failed_lst],
+        'results': result_lst
+    }
+
+    print(json.dumps(smry, indent=2))
+
+    return 1 if len(failed_lst) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Lightweight instrumentation for the hot paths in Gauge.
+
+Gauge methods are broken into named stages (network request, json decoding, parsing, DataFrame construction,
+etc.). When nothing is listening, entering a stage does no timing at all. Register a callback with ``add_hook``,
+or use the ``Profiler`` context manager, to receive a ``StageRecord`` for every stage as it completes.
+
+Example:
+
+    >>> from river_levels import Gauge
+    >>> from river_levels.instrumentation import Profiler
+    >>> with Profiler() as prof:
+    ...     df = Gauge('01646500', 'USGS').get_observations(period='week')
+    >>> prof.summary()
+
+Stages nest. The outermost stage of a call, such as ``total`` for ``get_observations``, starts a new call, and every
+stage entered within it, in the same thread or task, is recorded with the same ``call_id``, the ``parent_id`` of
+the stage containing it, and the attributes the containing stages were started with, such as the gauge id. Records
+for concurrent calls, such as gauges retrieved in parallel by the command line interface, can therefore be grouped
+by call.
+
+Records can also be forwarded to standard library logging with ``logging_hook`` or to OpenTelemetry-style spans
+with ``span_hook``.
+"""
+from contextvars import ContextVar
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, List
+
+__all__ = ['StageRecord', 'Profiler', 'add_hook', 'remove_hook', 'stage', 'logging_hook', 'span_hook']
+
+# callbacks invoked with a StageRecord when each stage completes
+_hooks = []
+
+# stage currently active in this thread or task, the parent of any stage entered
+_active_stage = ContextVar('river_levels_active_stage', default=None)
+
+# unique, increasing ids for stage records, so a parent always has a lower id than the stages within it
+_record_ids = itertools.count(1)
+
+_logger = logging.getLogger(__name__)
+
+
+class StageRecord(object):
+    """
+    Timing and attributes collected for one stage of an instrumented call.
+
+    The ``id`` is unique to the record, ``call_id`` is the id of the outermost stage of the call and ``parent_id``
+    is the id of the stage containing this one, or None for the outermost stage.
+    """
+
+    __slots__ = ('call', 'stage', 'id', 'call_id', 'parent_id', 'start', 'end', 'start_ns', 'end_ns', 'attributes')
+
+    def __init__(self, call: str, stage: str, attributes: dict = None, parent: 'StageRecord' = None) -> None:
+        self.call = call
+        self.stage = stage
+        self.id = next(_record_ids)
+        self.call_id = self.id if parent is None else parent.call_id
+        self.parent_id = None if parent is None else parent.id
+        self.start = None
+        self.end = None
+        self.start_ns = None
+        self.end_ns = None
+        self.attributes = {} if attributes is None else attributes
+
+    @property
+    def duration(self) -> float:
+        """Seconds elapsed in the stage."""
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes) -> None:
+        """Add attributes, such as row counts or bytes, to the record."""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        """Flatten the record into a dictionary."""
+        return {'call': self.call, 'stage': self.stage, 'id': self.id, 'call_id': self.call_id,
+                'parent_id': self.parent_id, 'duration': self.duration, **self.attributes}
+
+    def __repr__(self) -> str:
+        return f'StageRecord(call={self.call!r}, stage={self.stage!r}, id={self.id}, call_id={self.call_id}, ' \
+               f'parent_id={self.parent_id}, duration={self.duration}, attributes={self.attributes!r})'
+
+
+class _NullRecord(object):
+    """Stand-in record used when instrumentation is disabled, discarding everything."""
+
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        return
+
+
+class _NullStage(object):
+    """Stage context used when no hooks are registered, so disabled instrumentation costs next to nothing."""
+
+    __slots__ = ()
+
+    _record = _NullRecord()
+
+    def __enter__(self) -> _NullRecord:
+        return self._record
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class _Stage(object):
+    """Stage context timing the enclosed block and passing the completed record to the registered hooks."""
+
+    __slots__ = ('record', 'hooks', 'inherited', 'token')
+
+    def __init__(self, call: str, name: str, attributes: dict) -> None:
+        parent = _active_stage.get()
+
+        # attributes the containing stages were started with, such as the gauge id, are inherited
+        self.inherited = attributes if parent is None else {**parent.inherited, **attributes}
+        self.record = StageRecord(call, name, dict(self.inherited), None if parent is None else parent.record)
+
+        # snapshot the hooks so adding or removing a hook mid-stage does not break anything
+        self.hooks = list(_hooks)
+        self.token = None
+
+    def __enter__(self) -> StageRecord:
+        self.token = _active_stage.set(self)
+        self.record.start_ns = time.time_ns()
+        self.record.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.record.end = time.perf_counter()
+        self.record.end_ns = time.time_ns()
+        _active_stage.reset(self.token)
+
+        if exc_type is not None:
+            self.record.set(error=f'{exc_type.__name__}: {exc_val}')
+
+        # a failing hook must never break, or replace an exception raised by, the instrumented call
+        for hook in self.hooks:
+            try:
+                hook(self.record)
+            except Exception:
+                _logger.exception(f'Instrumentation hook {hook!r} failed for {self.record.call}.{self.record.stage}.')
+
+        return False
+
+
+def stage(call: str, name: str, **attributes):
+    """
+    Context manager for timing a stage of an instrumented call.
+
+    Args:
+        call: Name of the instrumented call, such as ``get_observations``.
+        name: Name of the stage within the call, such as ``request``.
+        **attributes: Initial attributes to include in the record.
+
+    Returns: Context manager yielding the record, so attributes can be added with ``record.set(rows=...)``.
+    """
+    if not _hooks:
+        return _null_stage
+    return _Stage(call, name, attributes)
+
+
+def add_hook(hook: Callable[[StageRecord], None]) -> Callable[[StageRecord], None]:
+    """
+    Register a callback invoked with a ``StageRecord`` each time an instrumented stage completes.
+
+    Args:
+        hook: Callable accepting a single ``StageRecord``.
+
+    Returns: The hook, so it can later be passed to ``remove_hook``.
+    """
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook: Callable[[StageRecord], None]) -> None:
+    """Unregister a callback previously registered with ``add_hook``."""
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+class Profiler(object):
+    """Context manager collecting every stage record while active."""
+
+    def __init__(self) -> None:
+        self.records: List[StageRecord] = []
+
+    def __call__(self, record: StageRecord) -> None:
+        self.records.append(record)
+
+    def __enter__(self) -> 'Profiler':
+        add_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        remove_hook(self)
+        return False
+
+    def to_frame(self):
+        """Pandas DataFrame with one row per stage record."""
+        import pandas as pd
+        return pd.DataFrame([r.to_dict() for r in self.records])
+
+    def summary(self):
+        """Pandas DataFrame of call count, total and mean seconds for each call and stage."""
+        df = self.to_frame()
+        if len(df.index) == 0:
+            return df
+        return df.groupby(['call', 'stage'], sort=False)['duration'].agg(['count', 'sum', 'mean'])
+
+    def by_call(self):
+        """Pandas DataFrame of seconds spent in each stage, with one row per call, indexed by call and call id."""
+        df = self.to_frame()
+        if len(df.index) == 0:
+            return df
+        return df.pivot_table(index=['call', 'call_id'], columns='stage', values='duration', aggfunc='sum',
+                              sort=False)
+
+
+def logging_hook(logger: logging.Logger = None, level: int = logging.DEBUG) -> Callable[[StageRecord], None]:
+    """
+    Create a hook emitting each stage record as a structured log message.
+
+    Args:
+        logger: Logger to emit to. Default is the ``river_levels`` logger.
+        level: Logging level for the messages. Default is DEBUG.
+
+    Returns: Hook to register with ``add_hook``. The record values are available on the log record under the
+        ``stage`` attribute for structured log handlers.
+    """
+    logger = logging.getLogger('river_levels') if logger is None else logger
+
+    def _hook(record: StageRecord) -> None:
+        if logger.isEnabledFor(level):
+            rec_dict = record.to_dict()
+            logger.log(level, f'{record.call}.{record.stage} {record.duration:.6f}s', extra={'stage': rec_dict})
+
+    return _hook
+
+
+def span_hook(tracer, set_span_in_context: Callable = None) -> Callable[[StageRecord], None]:
+    """
+    Create a hook emitting each stage record as an OpenTelemetry-style span, with the spans for nested stages as
+    children of the span for the stage containing them.
+
+    Nested stages complete before the stages containing them, so spans for a call are only emitted once the
+    outermost stage of the call completes.
+
+    Args:
+        tracer: Tracer exposing ``start_span(name, context=..., start_time=...)``, such as one from
+            ``opentelemetry.trace.get_tracer``. Spans are ended with ``span.end(end_time=...)``, with times in
+            nanoseconds since the epoch.
+        set_span_in_context: Optional
+            Callable creating the context to start a child span in from the parent span. Default is
+            ``opentelemetry.trace.set_span_in_context`` if OpenTelemetry is installed, otherwise the parent span
+            itself is passed as the context.
+
+    Returns: Hook to register with ``add_hook``.
+    """
+    if set_span_in_context is None:
+        try:
+            from opentelemetry.trace import set_span_in_context
+        except ImportError:
+            def set_span_in_context(span):
+                return span
+
+    # records for nested stages waiting on the outermost stage of their call, keyed by call id
+    pending = {}
+    pending_lock = threading.Lock()
+
+    def _start_span(record: StageRecord, context):
+        span = tracer.start_span(f'{record.call}.{record.stage}', context=context, start_time=record.start_ns)
+        for key, val in record.attributes.items():
+            span.set_attribute(key, val)
+        return span
+
+    def _hook(record: StageRecord) -> None:
+        with pending_lock:
+            if record.parent_id is not None:
+                pending.setdefault(record.call_id, []).append(record)
+                return
+            nested_lst = pending.pop(record.call_id, [])
+
+        # start spans in order of record id, so the parent span always exists before its children
+        span_dict = {record.id: _start_span(record, None)}
+        for nested in sorted(nested_lst, key=lambda r: r.id):
+            parent_span = span_dict.get(nested.parent_id, span_dict[record.id])
+            span_dict[nested.id] = _start_span(nested, set_span_in_context(parent_span))
+
+        for rec in [record] + nested_lst:
+            span_dict[rec.id].end(end_time=rec.end_ns)
+
+    return _hook
@@ -1,15 +1,19 @@
 from collections.abc import Iterable
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Union
-from warnings import warn
 
-from dateutil.relativedelta import relativedelta
 import pandas as pd
-import pytz
-import requests
+
+from . import sources
+from .buffer import ObservationBuffer
+from .instrumentation import stage
 
 __all__ = ['Gauge']
 
+# adapters shared by all gauges, so cached station files are reused
+_usgs_adapter = sources.UsgsAdapter()
+_wadoe_adapter = sources.WadoeAdapter()
+
 
 class Gauge(object):
 
@@ -18,10 +22,15 @@ class Gauge(object):
         'WADOE': 'Washington State Department of Ecology'
     }
 
+    # observations retained for each metric in values, 30 days at 15 minute resolution
+    buffer_capacity = 2880
+
     def __init__(self, gauge_id: str, source: str) -> None:
         self.id = gauge_id
         self.location = None
-        self.values = None
+
+        # ring buffers of recent observations keyed by metric, created as observations are appended
+        self.values = {}
 
         # validate source and set
         assert source.upper() in self.sources.keys(), f'Please provide a valid source ' \
@@ -30,7 +39,8 @@ class Gauge(object):
 
     def get_observations(self, metrics: Union[str, Iterable] = 'cfs', period: str = None, period_count: int = None,
                          start_date: datetime = None, end_date: datetime = None, 
-                         return_dataframe: bool = True) -> Union[dict, pd.DataFrame]:
+                         return_dataframe: bool = True,
+                         align_tolerance: Union[str, timedelta] = None) -> Union[dict, pd.DataFrame]:
         """
         Retrieve gauge observation(s). If no temporal parameters are provided, only the 
         most current observation is retrieved.
@@ -52,6 +62,10 @@ class Gauge(object):
                 this provides the end date for retrieval.
             return_dataframe: If a dataframe is desired to be returned. If False,
                 results are returned as a dictionary.
+            align_tolerance: If retrieving multiple metrics recorded at slightly
+                different times, align the other metrics onto the timestamps of the
+                first metric using the nearest observation within this tolerance,
+                such as '5min'. By default, all timestamps from all metrics are kept.
         """
         # provide default if period_count is not provided
         if period is not None and period_count is None:
@@ -76,147 +90,90 @@ class Gauge(object):
         fn_to_call = getattr(self, fn_name)
 
         # invoke the source function and return the result
-        return fn_to_call(metrics, period, period_count, start_date, end_date, return_dataframe)
+        return fn_to_call(metrics, period, period_count, start_date, end_date, return_dataframe, align_tolerance)
 
     def _get_observations_usgs(self, metrics: Union[str, Iterable] = 'cfs', period: str = None,
                                period_count: int = None, start_date: datetime = None, end_date: datetime = None,
-                               return_dataframe: bool = True):
+                               return_dataframe: bool = True, align_tolerance: Union[str, timedelta] = None):
         """USGS implementation for get_observations."""
+        return sources.get_observations(_usgs_adapter, self.id, metrics, period, period_count, start_date,
+                                        end_date, return_dataframe, align_tolerance)
+
+    def _get_observations_wadoe(self, metrics: Union[str, Iterable] = 'cfs', period: str = None,
+                                period_count: int = None, start_date: datetime = None, end_date: datetime = None,
+                                return_dataframe: bool = True, align_tolerance: Union[str, timedelta] = None):
+        """Washington State Department of Ecology implementation for get_observations."""
+        return sources.get_observations(_wadoe_adapter, self.id, metrics, period, period_count, start_date,
+                                        end_date, return_dataframe, align_tolerance)
+
+    def _get_buffer(self, metric: str, tz: str = 'UTC') -> ObservationBuffer:
+        """Get the buffer for a metric, creating it if necessary."""
+        metric = sources.normalize_metrics(metric)[0]
+        if metric not in self.values:
+            self.values[metric] = ObservationBuffer(self.buffer_capacity, tz)
+        return self.values[metric]
+
+    def append(self, timestamp: datetime, observations: dict) -> int:
+        """
+        Append a single observation for one or more metrics to the recent values retained by the gauge.
 
-        # url for real time water services
-        url = 'https://waterservices.usgs.gov/nwis/iv/'
-
-        # start building payload
-        data = {'format': 'json', 'sites': self.id}
-
-        # create list of gauge metric parameters and add to payload
-        mtrc_dict = {
-            'cfs': '00060',
-            'height': '00065',
-            'temperature': '00010'
-        }
-
-        # if a string provided, convert metrics to list and ensure all lowercase
-        metrics = [metrics] if isinstance(metrics, str) else metrics
-        metrics = [m.lower() for m in metrics]
-
-        # account for flow being used in lieu of cfs
-        metrics = ['cfs' if m == 'flow' else m for m in metrics]
-
-        # look up the metric codes
-        mtrc_lst = [mtrc_dict[mtrc] for mtrc in metrics]
-
-        # add metric codes onto payload as comma separated string
-        data['parameterCd'] = ','.join(mtrc_lst)
-
-        # create a list of period parameters if provided
-        if period:
-
-            # the rest endpoint can handle weeks or days
-            if period in ['week', 'day']:
-                prd_dict = {
-                    'week': 'W',
-                    'day': 'D'
-                }
-                data['period'] = f'P{period_count}{prd_dict[period]}'
-
-            # and we have to handle months or years
-            else:
-
-                # get today's datetime
-                now = datetime.now().astimezone()
-
-                # subtract the interval of months or years
-                if period == 'month':
-                    dt_years_ago = (now - relativedelta(months=period_count))
-                else:
-                    dt_years_ago = (now - relativedelta(years=period_count))
-
-                # zero out the hours and save as start time
-                start_date = dt_years_ago.replace(hour=0, minute=0, second=0, microsecond=0)
-
-                # set the end time to now
-                end_date = now
-
-        # validate dates and set into parameters if present
-        if end_date is not None:
-            assert start_date is not None, 'If providing an end_date, you must also provide a start_date.'
-            assert isinstance(end_date, datetime), 'end_date must be a Python datetime.datetime object.'
-            data['endDT'] = end_date.isoformat()
-
-        if start_date is not None:
-            assert isinstance(start_date, datetime), 'start_date must be a Python datetime.datetime object.'
-            data['startDT'] = start_date.isoformat()
-
-        # make the request
-        res = requests.get(url, params=data)
-
-        # ensure good response
-        assert res.status_code == 200
-
-        # unpack the payload - it's a mess of redundant nested keys
-        rjson = res.json()
-
-        # invert the metric dict for looking up metric types
-        mtrc_cd_dict = {mtrc_dict[k]: k for k in mtrc_dict}
-
-        # create a dict to populate
-        obs_dict = {}
-
-        # pull out the useful stuff
-        for ts in rjson['value']['timeSeries']:
-            variable_name = mtrc_cd_dict[ts['variable']['variableCode'][0]['value']]
-            obs_raw_lst = ts['values'][0]['value']
-            obs_dict[variable_name] = {datetime.fromisoformat(obs['dateTime']): obs['value'] for obs in obs_raw_lst}
-
-        # create an variable to populate with outputs
-        ret_val = {}
-
-        # iterate the observation types
-        for metric in obs_dict.keys():
-
-            # ensure data is returned for the chosen metric
-            if len(obs_dict[metric]):
+        Args:
+            timestamp: Time of the observation.
+            observations: Dictionary of metric names and observed values, such as {'cfs': 1250.0}.
 
-                # if no other metric has populated the output yet, create a dictionary using the timestamps as the keys
-                if len(ret_val) == 0:
+        Returns: Number of values added or replacing a value already retained for the same timestamp.
+        """
+        tz = getattr(timestamp, 'tzinfo', None) or 'UTC'
+        return sum(self._get_buffer(metric, tz).append(timestamp, val) for metric, val in observations.items()
+                   if val is not None)
 
-                    # create a dict with timestamp as key and a nested dict with the label and value
-                    ret_val = {k: {metric: float(v) if v.replace('.', '').isnumeric() else v}
-                               for k, v in obs_dict[metric].items()}
+    def extend(self, observations: pd.DataFrame) -> int:
+        """
+        Append observations, such as those returned from get_observations, to the recent values retained by the
+        gauge. Only the most recent ``buffer_capacity`` observations are retained for each metric.
 
-                # for subsequent metrics, tack onto existing dict
-                else:
-                    for key, val in obs_dict[metric].items():
-                        ret_val[key][metric] = val
+        Args:
+            observations: Pandas DataFrame indexed by timestamp with a column for each metric.
 
-            # warn if no data for metric
-            else:
-                warn(f'No data is available for the requested metric, {metric}.')
+        Returns: Number of values added or replacing a value already retained for the same timestamp.
+        """
+        tz = getattr(observations.index, 'tz', None) or 'UTC'
+        cnt = 0
+        for metric in observations.columns:
+            col = observations[metric].dropna()
+            cnt += self._get_buffer(metric, tz).extend(col.index, col.to_numpy())
+        return cnt
+
+    def poll(self, metrics: Union[str, Iterable] = 'cfs') -> int:
+        """
+        Retrieve the most current observation and append it to the recent values retained by the gauge.
 
-        # check requested metrics against returned metrics
-        ret_keys = [val for val in list(next(iter(ret_val.items()))[1].keys())]
-        not_ret_lst = [mtrc for mtrc in metrics if mtrc not in ret_keys]
-        if len(not_ret_lst):
-            warn(f'Although requested, {", ".join(not_ret_lst)} does not appear to be available at this site.')
+        Args:
+            metrics: Desired metric to be retrieved, cfs (or flow), height or
+                temperature. If multiple, input as a list ['cfs', 'height',
+                'temperature'].
 
-        # if a dataframe is desired, create it
-        if return_dataframe:
-            ret_val = pd.DataFrame.from_dict(ret_val, orient='index')
+        Returns: Number of values added or replacing a value already retained for the same timestamp.
+        """
+        return self.extend(self.get_observations(metrics=metrics))
 
-            # get the applicable timezone
-            dt_dict = {
-                'PST': 'US/Pacific',
-                'AKST': 'US/Alaska',
-                'EST': 'US/Eastern',
-                'MST': 'US/Mountain',
-                'CST': 'US/Central'
-            }
-            tz_nm = dt_dict[ts['sourceInfo']['timeZoneInfo']['defaultTimeZone']['zoneAbbreviation']]
+    def get_values(self, metrics: Union[str, Iterable] = None, start_date: datetime = None,
+                   end_date: datetime = None) -> pd.DataFrame:
+        """
+        Get the recent values retained by the gauge as a DataFrame.
 
-            ret_val.index = [dt.astimezone(pytz.timezone(tz_nm)) for dt in ret_val.index]
+        Args:
+            metrics: Metrics to include. Default is all metrics retained.
+            start_date: Only include observations at or after this time.
+            end_date: Only include observations at or before this time.
 
-        return ret_val
+        Returns: Pandas DataFrame indexed by timestamp with a column for each metric.
+        """
+        metrics = list(self.values.keys()) if metrics is None else sources.normalize_metrics(metrics)
+        ser_lst = [self.values[m].to_series(start_date, end_date, name=m) for m in metrics if m in self.values]
+        if len(ser_lst) == 0:
+            return pd.DataFrame()
+        return pd.concat(ser_lst, axis=1, join='outer', sort=True)
 
     def get_rolling_mean(self, metric: str = 'cfs', min: Union[int, float] = None, max: Union[int, float] = None,
                          period_count: int = 5, period: str = 'year', start_date: datetime = None,
@@ -239,53 +196,63 @@ class Gauge(object):
 
         """
 
-        # retrive observations
-        obs = self.get_observations(period=period, period_count=period_count, metrics=metric, start_date=start_date,
-                                    end_date=end_date)
+        # the outermost stage identifies the call, with the gauge inherited by every stage within it
+        with stage('get_rolling_mean', 'total', gauge_id=self.id):
+
+            # retrive observations
+            with stage('get_rolling_mean', 'observations') as rec:
+                obs = self.get_observations(period=period, period_count=period_count, metrics=metric,
+                                            start_date=start_date, end_date=end_date)
+                rec.set(rows=len(obs.index))
+
+            # standardize the dataframe
+            obs.rename(columns={metric: 'flow'}, inplace=True)
 
-        # standardize the dataframe
-        obs.rename(columns={metric: 'flow'}, inplace=True)
+            # calculate the mean and standard deviation over a rolling window
+            with stage('get_rolling_mean', 'rolling', rows=len(obs.index)):
+                mean_df = obs['flow'].rolling(rolling_window).mean()
+                std_df = obs['flow'].rolling(rolling_window).std()
 
+                # combine the means and standard deviations
+                obs_join = obs.join(mean_df, rsuffix='_mean').join(std_df, rsuffix='_std')
 
-        # calculate the mean and standard deviation over a rolling window
-        mean_df = obs['flow'].rolling(rolling_window).mean()
-        std_df = obs['flow'].rolling(rolling_window).std()
+            # calculate a curve one standard deviation above and below the mean
+            obs_join[f'flow_plus_std'] = obs_join[f'flow_mean'] + obs_join[f'flow_std']
+            obs_join[f'flow_less_std'] = obs_join[f'flow_mean'] - obs_join[f'flow_std']
 
-        # combine the means and standard deviations
-        obs_join = obs.join(mean_df, rsuffix='_mean').join(std_df, rsuffix='_std')
+            with stage('get_rolling_mean', 'concat') as rec:
 
-        # calculate a curve one standard deviation above and below the mean
-        obs_join[f'flow_plus_std'] = obs_join[f'flow_mean'] + obs_join[f'flow_std']
-        obs_join[f'flow_less_std'] = obs_join[f'flow_mean'] - obs_join[f'flow_std']
+                # drop out leap year days
+                obs_nrml = obs_join[~((obs_join.index.month == 2) & (obs_join.index.day == 29))].copy()
+                obs_nrml['timestamp'] = [val.replace(year=1973) for val in obs_nrml.index]
 
-        # drop out leap year days
-        obs_nrml = obs_join[~((obs_join.index.month == 2) & (obs_join.index.day == 29))].copy()
-        obs_nrml['timestamp'] = [val.replace(year=1973) for val in obs_nrml.index]
+                # tack on values for the preceeding and trailing months to ensure the curve covers an entire year
+                lead_obs = obs_nrml[obs_nrml.index.month == 12].copy()
+                lead_obs['timestamp'] = [val.replace(year=1972) for val in lead_obs.index]
+                lag_obs = obs_nrml[obs_nrml.index.month == 1].copy()
+                lag_obs['timestamp'] = [val.replace(year=1973) for val in lag_obs.index]
+                obs_nrml = pd.concat([obs_nrml, lead_obs, lag_obs])
 
-        # tack on values for the preceeding and trailing months to ensure the curve covers an entire year
-        lead_obs = obs_nrml[obs_nrml.index.month == 12].copy()
-        lead_obs['timestamp'] = [val.replace(year=1972) for val in lead_obs.index]
-        lag_obs = obs_nrml[obs_nrml.index.month == 1].copy()
-        lag_obs['timestamp'] = [val.replace(year=1973) for val in lag_obs.index]
-        obs_nrml = pd.concat([obs_nrml, lead_obs, lag_obs])
+                rec.set(rows=len(obs_nrml.index))
 
-        # create an average curve table for one year
-        mean_cols = [f'flow_mean', f'flow_plus_std', f'flow_less_std', 'timestamp']
-        mean_df = obs_nrml[mean_cols].groupby('timestamp').mean()
+            # create an average curve table for one year
+            with stage('get_rolling_mean', 'groupby', rows=len(obs_nrml.index)):
+                mean_cols = [f'flow_mean', f'flow_plus_std', f'flow_less_std', 'timestamp']
+                mean_df = obs_nrml[mean_cols].groupby('timestamp').mean()
 
-        # if min and max range flows are provided, add them
-        if min is not None:
-            mean_df[f'flow_bott'] = min
-        if max is not None:
-            mean_df[f'flow_top'] = max
+            # if min and max range flows are provided, add them
+            if min is not None:
+                mean_df[f'flow_bott'] = min
+            if max is not None:
+                mean_df[f'flow_top'] = max
 
-        # consolidate into days...because nobody wants needs every 15 minutes for an entire year
-        mean_df = mean_df.groupby(pd.Grouper(freq='D')).mean()
+            # consolidate into days...because nobody wants needs every 15 minutes for an entire year
+            mean_df = mean_df.groupby(pd.Grouper(freq='D')).mean()
 
-        # if smoothing the curve (a VERY good idea), do it
-        if apply_smoothing:
-            mean_df = mean_df.rolling(window=5).mean()
+            # if smoothing the curve (a VERY good idea), do it
+            if apply_smoothing:
+                mean_df = mean_df.rolling(window=5).mean()
 
-        mean_df = mean_df[mean_df.index.year == 1973].copy()
+            mean_df = mean_df[mean_df.index.year == 1973].copy()
 
-        return mean_df
+            return mean_df
@@ -0,0 +1,381 @@
+"""
+Tests for the ck_tools support package using local stand-ins for the Web GIS and arcpy.
+"""
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('arcgis')
+
+import ck_tools
+from ck_tools import main as ck_main
+
+
+class FakeGroup(object):
+    """Group stand-in only tracking the title."""
+
+    def __init__(self, title):
+        self.title = title
+
+
+class FakeGroupManager(object):
+
+    def __init__(self, titles):
+        self.groups = [FakeGroup(t) for t in titles]
+        self.queries = []
+
+    def search(self, query='', **kwargs):
+        self.queries.append(query)
+        title = query.split(':', 1)[1].strip('"').lower() if len(query) else ''
+        return [g for g in self.groups if title in g.title.lower()]
+
+    def create(self, title, **kwargs):
+        grp = FakeGroup(title)
+        self.groups.append(grp)
+        return grp
+
+
+class FakeFolder(object):
+    """Folder stand-in shaped like the objects returned by current versions of the API."""
+
+    def __init__(self, title, folder_id):
+        self.name = title
+        self.properties = {'title': title, 'id': folder_id, 'username': 'tester'}
+
+
+class FakeUser(object):
+
+    def __init__(self, folders):
+        self.folder_titles = folders
+        self.folder_requests = 0
+
+    @property
+    def folders(self):
+        self.folder_requests += 1
+        return (FakeFolder(f, str(idx)) for idx, f in enumerate(self.folder_titles))
+
+
+class FakeUserManager(object):
+
+    def __init__(self, me):
+        self.me = me
+
+
+class FakeFolderManager(object):
+
+    def __init__(self, user):
+        self.user = user
+        self.created = []
+
+    def get(self, folder=None, owner=None):
+        return next((f for f in self.user.folders if f.name.lower() == folder.lower()), None)
+
+    def create(self, folder, owner=None, exist_ok=False):
+        self.created.append(folder)
+        self.user.folder_titles.append(folder)
+        return FakeFolder(folder, 'new')
+
+
+class FakeContentManager(object):
+
+    def __init__(self, user):
+        self.folders = FakeFolderManager(user)
+
+
+class FakeLegacyContentManager(object):
+    """Content manager stand-in for versions of the API before folders were managed as objects."""
+
+    def __init__(self, user):
+        self.user = user
+        self.created = []
+
+    def create_folder(self, folder, owner=None):
+        self.created.append(folder)
+        self.user.folder_titles.append(folder)
+        return {'title': folder, 'id': 'new', 'username': 'tester'}
+
+
+class FakeGIS(object):
+    """GIS stand-in tracking logins, group searches and folder requests."""
+
+    logins = 0
+
+    def __init__(self, url=None, username=None, password=None, **kwargs):
+        FakeGIS.logins += 1
+        self.groups = FakeGroupManager(['River Levels Project', 'River Levels Project Archive', 'Other'])
+        self.users = FakeUserManager(FakeUser(['existing']))
+        self.content = FakeContentManager(self.users.me)
+
+
+@pytest.fixture(autouse=True)
+def fake_env(monkeypatch):
+    monkeypatch.setattr(ck_main, 'GIS', FakeGIS)
+    monkeypatch.setattr(ck_main, 'Group', FakeGroup)
+    monkeypatch.setattr(ck_main.env, 'active_gis', None)
+    monkeypatch.setenv('ESRI_GIS_USERNAME', 'tester')
+    monkeypatch.setenv('ESRI_GIS_PASSWORD', 'secret')
+    monkeypatch.delenv('ESRI_GIS_URL', raising=False)
+    FakeGIS.logins = 0
+    ck_tools.clear_cache()
+    yield
+    ck_tools.clear_cache()
+
+
+def test_get_gis_reuses_login():
+    gis = ck_tools.get_gis()
+    assert ck_tools.get_gis() is gis
+    assert FakeGIS.logins == 1
+
+
+def test_get_gis_refresh(monkeypatch):
+    gis = ck_tools.get_gis()
+    assert ck_tools.get_gis(refresh=True) is not gis
+
+    # an expired session is replaced with a new login
+    monkeypatch.setattr(ck_main, 'GIS_SESSION_TTL', 0)
+    ck_tools.get_gis()
+    assert FakeGIS.logins == 3
+
+
+def test_get_gis_without_credentials(monkeypatch):
+    monkeypatch.delenv('ESRI_GIS_USERNAME')
+    assert ck_tools.get_gis() is None
+
+
+def test_add_group_existing_uses_server_query():
+    gis = ck_tools.get_gis()
+    grp = ck_tools.add_group(gis, 'river levels project')
+    assert grp.title == 'River Levels Project'
+    assert gis.groups.queries == ['title:"river levels project"']
+
+    # resolved groups are cached
+    assert ck_tools.add_group(gis, 'River Levels Project') is grp
+    assert len(gis.groups.queries) == 1
+
+
+def test_add_group_creates_missing():
+    gis = ck_tools.get_gis()
+    grp = ck_tools.add_group(gis, 'New Group')
+    assert grp.title == 'New Group'
+    assert len(gis.groups.groups) == 4
+
+
+def test_add_directory_to_gis():
+    gis = ck_tools.get_gis()
+    assert ck_tools.add_directory_to_gis('Existing', gis)
+    assert gis.content.folders.created == []
+
+    assert ck_tools.add_directory_to_gis('new-folder', gis)
+    assert ck_tools.add_directory_to_gis('new-folder', gis)
+    assert gis.content.folders.created == ['new-folder']
+    assert gis.users.me.folder_requests == 2
+
+
+def test_add_directory_to_gis_legacy_folders(monkeypatch):
+    gis = ck_tools.get_gis()
+    gis.content = FakeLegacyContentManager(gis.users.me)
+    monkeypatch.setattr(FakeUser, 'folders', property(
+        lambda self: [{'title': f, 'id': str(idx)} for idx, f in enumerate(self.folder_titles)]))
+
+    assert ck_tools.add_directory_to_gis('existing', gis)
+    assert ck_tools.add_directory_to_gis('new-folder', gis)
+    assert gis.content.created == ['new-folder']
+
+
+class FakeArcpy(object):
+    """Stand-in for the arcpy geodatabase tools, creating directories and files in place of geodatabases."""
+
+    def __init__(self, version='2.8'):
+        self.version = version
+        self.management = self
+        self.created = []
+
+    def GetInstallInfo(self):
+        return {'Version': self.version}
+
+    def CreateFileGDB(self, out_folder_path, out_name):
+        self.created.append(out_name)
+        (Path(out_folder_path) / out_name).mkdir()
+
+    def CreateMobileGDB(self, out_folder_path, out_name):
+        self.created.append(out_name)
+        (Path(out_folder_path) / out_name).touch()
+
+
+def test_create_local_data_resources_without_arcpy(tmp_path, monkeypatch):
+    monkeypatch.setattr(ck_main, 'has_arcpy', False)
+    report = ck_tools.create_local_data_resources(tmp_path / 'data')
+    assert len(report['created']) == 4
+    assert len(report['skipped']) == 4
+    assert (tmp_path / 'data' / 'raw').is_dir()
+
+    report = ck_tools.create_local_data_resources(tmp_path / 'data')
+    assert report['created'] == []
+    assert len(report['existing']) == 4
+
+
+def test_create_local_data_resources_idempotent(tmp_path, monkeypatch):
+    fake_arcpy = FakeArcpy()
+    monkeypatch.setattr(ck_main, 'has_arcpy', True)
+    monkeypatch.setattr(ck_main, 'arcpy', fake_arcpy, raising=False)
+
+    report = ck_tools.create_local_data_resources(tmp_path, mobile_geodatabases=True)
+    assert len(report['created']) == 12
+    (tmp_path / 'raw' / 'raw.gdb' / 'keep').touch()
+
+    # nothing is touched on a repeated run
+    report = ck_tools.create_local_data_resources(tmp_path, mobile_geodatabases=True)
+    assert report['created'] == [] and report['rebuilt'] == []
+    assert len(report['existing']) == 12
+    assert (tmp_path / 'raw' / 'raw.gdb' / 'keep').exists()
+
+    # only an upgrade of Pro triggers recreating the geodatabases
+    fake_arcpy.version = '3.0'
+    report = ck_tools.create_local_data_resources(tmp_path, mobile_geodatabases=True)
+    assert len(report['rebuilt']) == 8
+    assert not (tmp_path / 'raw' / 'raw.gdb' / 'keep').exists()
+
+
+def test_paths_manifest():
+    manifest = ck_tools.paths.manifest
+    assert manifest['gdb_raw'] == ck_tools.Paths.gdb_raw
+    assert all(isinstance(p, Path) for p in manifest.values())
+
+
+class FakeFeature(object):
+
+    def __init__(self, attributes, geometry=None):
+        self.attributes = attributes
+        self.geometry = geometry
+
+
+class FakeFeatureLayer(object):
+    """Feature layer stand-in storing features in a dictionary keyed by object id."""
+
+    def __init__(self, max_record_count=1000):
+        self.properties = type('Properties', (object,), {'maxRecordCount': max_record_count,
+                                                         'objectIdField': 'OBJECTID'})()
+        self.rows = {}
+        self.edit_calls = []
+        self.query_calls = 0
+
+    def query(self, **kwargs):
+        self.query_calls += 1
+        features = [FakeFeature({**attrs, 'OBJECTID': oid}, geom) for oid, (attrs, geom) in self.rows.items()]
+        return type('FeatureSet', (object,), {'features': features})()
+
+    def edit_features(self, adds=None, updates=None, **kwargs):
+        self.edit_calls.append((len(adds or []), len(updates or [])))
+        add_res, upd_res = [], []
+        for f in adds or []:
+            oid = len(self.rows) + 1
+            self.rows[oid] = (dict(f['attributes']), f.get('geometry'))
+            add_res.append({'objectId': oid, 'success': True})
+        for f in updates or []:
+            attrs = dict(f['attributes'])
+            oid = attrs.pop('OBJECTID')
+            self.rows[oid] = ({**self.rows[oid][0], **attrs}, f.get('geometry', self.rows[oid][1]))
+            upd_res.append({'objectId': oid, 'success': True})
+        return {'addResults': add_res, 'updateResults': upd_res, 'deleteResults': []}
+
+
+def _gauge_features(count, cfs=100.0):
+    return [{'attributes': {'gauge_id': f'{idx:08d}', 'cfs': cfs, 'status': 'runnable'},
+             'geometry': {'x': -122.0 + idx / 1000, 'y': 47.0, 'spatialReference': {'wkid': 4326}}}
+            for idx in range(count)]
+
+
+def test_publisher_batches_adds():
+    lyr = FakeFeatureLayer(max_record_count=100)
+    pub = ck_tools.FeatureLayerPublisher(lyr, max_workers=3)
+    report = pub.publish(_gauge_features(250))
+    assert report['added'] == 250 and report['batches'] == 3
+    assert sorted(lyr.edit_calls) == [(50, 0), (100, 0), (100, 0)]
+    assert len(lyr.rows) == 250
+
+
+def test_publisher_only_sends_changes():
+    lyr = FakeFeatureLayer()
+    ck_tools.FeatureLayerPublisher(lyr, batch_size=10).publish(_gauge_features(20))
+
+    # a new publisher diffs against what is already in the layer
+    pub = ck_tools.FeatureLayerPublisher(lyr, batch_size=10)
+    features = _gauge_features(25)
+    features[0]['attributes']['cfs'] = 250.0
+    lyr.edit_calls = []
+    report = pub.publish(features)
+    assert (report['added'], report['updated'], report['unchanged']) == (5, 1, 19)
+    assert lyr.edit_calls == [(5, 1)]
+    assert lyr.rows[1][0]['cfs'] == 250.0
+
+    # publishing the same thing again sends nothing and does not query the layer again
+    lyr.edit_calls = []
+    report = pub.publish(features)
+    assert report['unchanged'] == 25 and report['batches'] == 0
+    assert lyr.edit_calls == [] and lyr.query_calls == 2
+
+
+def test_publisher_reports_failures():
+    lyr = FakeFeatureLayer()
+
+    def _fail(**kwargs):
+        raise RuntimeError('service unavailable')
+
+    lyr.edit_features = _fail
+    report = ck_tools.FeatureLayerPublisher(lyr).publish(_gauge_features(3))
+    assert report['added'] == 0
+    assert len(report['failures']) == 3
+    assert 'service unavailable' in report['failures'][0]['error']
+
+
+def test_publisher_requires_geometry_for_adds():
+    lyr = FakeFeatureLayer()
+    pub = ck_tools.FeatureLayerPublisher(lyr)
+    features = _gauge_features(3)
+    del features[0]['geometry']
+    report = pub.publish(features)
+    assert report['added'] == 2
+    assert report['failures'][0]['key'] == ('00000000',)
+
+    # once in the layer, a feature can be updated without a geometry
+    features = _gauge_features(3, cfs=150.0)
+    pub.publish(features)
+    del features[1]['geometry']
+    features[1]['attributes']['cfs'] = 175.0
+    report = pub.publish(features)
+    assert report['updated'] == 1 and report['failures'] == []
+    assert lyr.rows[1][1] is not None
+
+
+def test_gauge_feature():
+    import pandas as pd
+
+    class _Gauge(object):
+        id = '01646500'
+        source = 'USGS'
+        location = {'x': -77.1, 'y': 38.9, 'spatialReference': {'wkid': 4326}}
+
+        def get_observations(self, metrics):
+            idx = pd.date_range('2020-06-01', periods=2, freq='15min', tz='US/Eastern')
+            return pd.DataFrame({'cfs': [900.0, 1200.0]}, index=idx)
+
+    feature = ck_tools.gauge_feature(_Gauge(), low=1000, high=5000)
+    assert feature['attributes']['cfs'] == 1200.0
+    assert feature['attributes']['status'] == 'runnable'
+    assert feature['attributes']['observed'] == 1590984900000
+    assert feature['geometry']['x'] == -77.1
+
+    # without thresholds the status cannot be determined
+    assert ck_tools.gauge_feature(_Gauge())['attributes']['status'] == 'unknown'
+    assert ck_tools.gauge_feature(_Gauge(), high=1000)['attributes']['status'] == 'high'
+
+    # the status is never determined from a different metric than the first requested
+    class _TemperatureGauge(_Gauge):
+
+        def get_observations(self, metrics):
+            idx = pd.date_range('2020-06-01', periods=2, freq='15min', tz='US/Eastern')
+            return pd.DataFrame({'temperature': [12.0, 12.5]}, index=idx)
+
+    feature = ck_tools.gauge_feature(_TemperatureGauge(), metrics=['flow', 'temperature'], low=1000, high=5000)
+    assert feature['attributes']['temperature'] == 12.5
+    assert feature['attributes']['status'] == 'unknown'
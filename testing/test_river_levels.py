@@ -3,19 +3,28 @@ This is a stubbed out test file designed to be used with PyTest, but can
 easily be modified to support any testing framework.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pytest
+import pytz
 
 # get paths to useful resources - notably where the src directory is
 self_pth = Path(__file__)
 dir_test = self_pth.parent
 dir_prj = dir_test.parent
 dir_src = dir_prj / 'src'
+dir_data = dir_test / 'data'
 
 # insert the src directory into the path and import the project package
 # sys.path.insert(0, str(dir_src))
 import river_levels
+from river_levels import catalog, cli, sources
+from river_levels.instrumentation import Profiler, add_hook, remove_hook, span_hook, stage
 
 usgs_id = '01646500'  # potomac since has both cfs and temp
 # usgs_id = '14224000' # ohane
@@ -62,3 +71,492 @@ def test_get_usgs_gauge_one_year():
     assert obs.all().all()
     assert isinstance(obs, pd.DataFrame)
     assert len(obs.index) > 30000
+
+
+def _fake_observations(self, metrics='cfs', **kwargs):
+    idx = pd.date_range(datetime(2020, 6, 1), periods=4, freq='15min', tz=pytz.timezone('US/Eastern'))
+    return pd.DataFrame({'cfs': [10.0, 11.0, 12.0, 13.0]}, index=idx)
+
+
+def test_cli_read_gauge_list(tmp_path):
+    gauge_file = tmp_path / 'gauges.txt'
+    gauge_file.write_text('# potomac\n01646500\n\n14224000, usgs\n01646500\n')
+    gauge_lst = cli.read_gauge_list(gauge_file)
+    assert gauge_lst == [('01646500', 'USGS'), ('14224000', 'USGS')]
+
+
+def test_cli_export_and_resume(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(river_levels.Gauge, 'get_observations', _fake_observations)
+    gauge_file = tmp_path / 'gauges.txt'
+    gauge_file.write_text('01646500\n14224000\n')
+    out_dir = tmp_path / 'out'
+
+    assert cli.main([str(gauge_file), '-o', str(out_dir), '-f', 'csv', '-w', '2']) == 0
+    smry = json.loads(capsys.readouterr().out)
+    assert smry['completed'] == 2 and smry['finished']
+    assert smry['bytes'] > 0
+    assert (out_dir / 'usgs_01646500.csv').exists()
+
+    # a finished run is not resumed, so a scheduled rerun retrieves everything again
+    assert cli.main([str(gauge_file), '-o', str(out_dir), '-f', 'csv']) == 0
+    smry = json.loads(capsys.readouterr().out)
+    assert smry['completed'] == 2 and not smry['resumed']
+
+    # an interrupted run only resumes with identical parameters
+    manifest = json.loads((out_dir / cli.MANIFEST_FILE).read_text())
+    manifest['finished'] = False
+    del manifest['gauges']['USGS:14224000']
+    (out_dir / cli.MANIFEST_FILE).write_text(json.dumps(manifest))
+    assert cli.main([str(gauge_file), '-o', str(out_dir), '-f', 'csv', '-m', 'flow']) == 0
+    smry = json.loads(capsys.readouterr().out)
+    assert smry['resumed'] and (smry['skipped'], smry['completed']) == (1, 1)
+
+    (out_dir / cli.MANIFEST_FILE).write_text(json.dumps(manifest))
+    assert cli.main([str(gauge_file), '-o', str(out_dir), '-f', 'csv', '--period', 'week']) == 0
+    smry = json.loads(capsys.readouterr().out)
+    assert not smry['resumed'] and smry['completed'] == 2
+
+
+def test_cli_retries_empty(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(river_levels.Gauge, 'get_observations', lambda self, **kwargs: pd.DataFrame())
+    gauge_file = tmp_path / 'gauges.txt'
+    gauge_file.write_text('01646500\n')
+
+    assert cli.main([str(gauge_file), '-o', str(tmp_path), '-f', 'csv']) == 0
+    smry = json.loads(capsys.readouterr().out)
+    assert smry['empty'] == 1 and not smry['finished']
+    assert not (tmp_path / 'usgs_01646500.csv').exists()
+
+    # an empty result is retrieved again when the run is resumed
+    monkeypatch.setattr(river_levels.Gauge, 'get_observations', _fake_observations)
+    assert cli.main([str(gauge_file), '-o', str(tmp_path), '-f', 'csv']) == 0
+    smry = json.loads(capsys.readouterr().out)
+    assert smry['resumed'] and smry['completed'] == 1 and smry['finished']
+
+
+def test_cli_scheduled_runs_with_dead_gauge(tmp_path, monkeypatch, capsys):
+    def _observations(self, **kwargs):
+        return pd.DataFrame() if self.id == 'DEAD' else _fake_observations(self)
+
+    monkeypatch.setattr(river_levels.Gauge, 'get_observations', _observations)
+    gauge_file = tmp_path / 'gauges.txt'
+    gauge_file.write_text('01646500\n14224000\nDEAD\n')
+    manifest_path = tmp_path / cli.MANIFEST_FILE
+
+    for _ in range(2):
+        assert cli.main([str(gauge_file), '-o', str(tmp_path), '-f', 'csv', '--period', 'week']) == 0
+        smry = json.loads(capsys.readouterr().out)
+        assert not smry['resumed'] and not smry['finished']
+        assert (smry['completed'], smry['empty']) == (2, 1)
+
+        # the next scheduled run starts a day later, well outside the resume window
+        manifest = json.loads(manifest_path.read_text())
+        manifest['started'] = (datetime.fromisoformat(manifest['started']) - timedelta(days=1)).isoformat()
+        manifest_path.write_text(json.dumps(manifest))
+
+
+def test_cli_reports_failures(tmp_path, monkeypatch, capsys):
+    def _fail(self, **kwargs):
+        raise ConnectionError('no network')
+
+    monkeypatch.setattr(river_levels.Gauge, 'get_observations', _fail)
+    gauge_file = tmp_path / 'gauges.txt'
+    gauge_file.write_text('01646500\n')
+
+    assert cli.main([str(gauge_file), '-o', str(tmp_path), '-f', 'csv']) == 1
+    smry = json.loads(capsys.readouterr().out)
+    assert smry['failed'] == 1
+    assert 'no network' in smry['failures'][0]['error']
+
+
+class _FakeResponse(object):
+    """Recorded response standing in for a live request."""
+
+    def __init__(self, pth: Path):
+        self.content = pth.read_bytes()
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _fake_usgs_get(url, params=None, **kwargs):
+    return _FakeResponse(dir_data / 'usgs_iv_01646500.json')
+
+
+def test_profiler_records_observation_stages(monkeypatch):
+    monkeypatch.setattr(sources.requests, 'get', _fake_usgs_get)
+    with Profiler() as prof:
+        river_levels.Gauge(gauge_id=usgs_id, source='USGS').get_observations(['cfs', 'temperature'])
+
+    # finer stages are recorded within decode and normalize, finishing before the enclosing stage
+    stages = [r.stage for r in prof.records]
+    assert stages == ['request', 'json', 'parse', 'decode', 'dataframe', 'timezone', 'dataframe', 'timezone',
+                      'join', 'normalize', 'total']
+    rec_dict = {r.stage: r for r in prof.records}
+    assert rec_dict['request'].attributes['bytes'] > 0
+    assert rec_dict['parse'].attributes['rows'] == 16
+    assert rec_dict['decode'].attributes['rows'] == 16
+    assert rec_dict['dataframe'].attributes == {'source': 'USGS', 'gauge_id': usgs_id, 'metric': 'temperature',
+                                                'rows': 8}
+
+    # every stage belongs to the same call, nested under the stage containing it
+    assert {r.call_id for r in prof.records} == {rec_dict['total'].id}
+    assert rec_dict['total'].parent_id is None
+    assert rec_dict['decode'].parent_id == rec_dict['total'].id
+    assert rec_dict['json'].parent_id == rec_dict['decode'].id
+    assert rec_dict['join'].parent_id == rec_dict['normalize'].id
+    assert rec_dict['join'].attributes['rows'] == 1
+    assert rec_dict['normalize'].attributes['rows'] == 1
+    assert rec_dict['json'].start_ns >= rec_dict['decode'].start_ns
+    assert rec_dict['json'].end_ns <= rec_dict['parse'].start_ns <= rec_dict['decode'].end_ns
+    assert all(r.duration >= 0 for r in prof.records)
+    assert len(prof.summary().index) == 9
+    assert len(prof.by_call().index) == 1
+
+
+def test_profiler_groups_concurrent_calls(monkeypatch):
+    monkeypatch.setattr(sources.requests, 'get', _fake_usgs_get)
+    with Profiler() as prof:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: river_levels.Gauge(usgs_id, 'USGS').get_observations('cfs'), range(4)))
+
+    # stages interleave across threads, but each call is still grouped under its own id
+    by_call = prof.by_call()
+    assert len(by_call.index) == 4
+    assert by_call.notna().all().all()
+    for call_id in by_call.index.get_level_values('call_id'):
+        assert len([r for r in prof.records if r.call_id == call_id]) == 9
+
+
+def test_instrumentation_hook_failure(caplog):
+    def _fail(record):
+        raise RuntimeError('tracer unavailable')
+
+    rec_lst = []
+    hook_lst = [add_hook(_fail), add_hook(rec_lst.append)]
+    try:
+        with stage('call', 'stage'):
+            pass
+
+        # the exception raised within the stage is not replaced by the failing hook
+        with pytest.raises(ValueError, match='bad value'):
+            with stage('call', 'stage'):
+                raise ValueError('bad value')
+    finally:
+        for hook in hook_lst:
+            remove_hook(hook)
+
+    assert len(rec_lst) == 2
+    assert 'tracer unavailable' in caplog.text
+
+
+class _FakeSpan(object):
+
+    def __init__(self, name, context):
+        self.name = name
+        self.context = context
+        self.attributes = {}
+        self.ended = False
+
+    def set_attribute(self, key, val):
+        self.attributes[key] = val
+
+    def end(self, end_time=None):
+        self.ended = True
+
+
+class _FakeTracer(object):
+
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, context=None, start_time=None):
+        span = _FakeSpan(name, context)
+        self.spans.append(span)
+        return span
+
+
+def test_span_hook_nests_spans(monkeypatch):
+    monkeypatch.setattr(sources.requests, 'get', _fake_usgs_get)
+    tracer = _FakeTracer()
+    hook = add_hook(span_hook(tracer, set_span_in_context=lambda span: span))
+    try:
+        river_levels.Gauge(usgs_id, 'USGS').get_observations('cfs')
+    finally:
+        remove_hook(hook)
+
+    span_dict = {span.name: span for span in tracer.spans}
+    assert tracer.spans[0].name == 'get_observations.total' and tracer.spans[0].context is None
+    assert span_dict['get_observations.decode'].context is span_dict['get_observations.total']
+    assert span_dict['get_observations.json'].context is span_dict['get_observations.decode']
+    assert span_dict['get_observations.join'].context is span_dict['get_observations.normalize']
+    assert all(span.ended for span in tracer.spans)
+
+
+def test_instrumentation_disabled_without_hooks():
+    with stage('call', 'stage') as rec:
+        rec.set(rows=1)
+    assert not hasattr(rec, 'attributes')
+
+    rec_lst = []
+    hook = add_hook(rec_lst.append)
+    with stage('call', 'stage') as rec:
+        rec.set(rows=1)
+    remove_hook(hook)
+    assert rec_lst[0].attributes == {'rows': 1}
+
+
+class _FakeWadoe(object):
+    """Serve recorded station files in place of the Ecology website, counting requests."""
+
+    last_modified = 'Mon, 01 Jun 2020 08:00:00 GMT'
+
+    def __init__(self):
+        self.requests = []
+        self.headers = []
+
+    def __call__(self, url, headers=None, **kwargs):
+        self.requests.append(url)
+        self.headers.append(headers)
+        fixture = dir_data / f'wadoe_{url.split("/")[-1]}'
+        res = _FakeResponse(fixture) if fixture.exists() else type('Response', (object,), {'status_code': 404})()
+        if fixture.exists():
+            res.headers['Last-Modified'] = self.last_modified
+        if headers is not None and headers.get('If-Modified-Since') == self.last_modified and fixture.exists():
+            res.status_code = 304
+        return res
+
+
+def test_get_wadoe_gauge(tmp_path, monkeypatch):
+    monkeypatch.setenv('RIVER_LEVELS_CACHE', str(tmp_path))
+    monkeypatch.setattr(sources.requests, 'get', _FakeWadoe())
+    gauge = river_levels.Gauge(gauge_id='45A070', source='WADOE')
+    obs = gauge.get_observations('flow', start_date=datetime(2020, 5, 31, 21), end_date=datetime(2020, 6, 1))
+
+    # times are converted from standard time, and the missing reading is skipped
+    assert list(obs.columns) == ['cfs']
+    assert obs.index[0] == pd.Timestamp('2020-05-31 21:00', tz='US/Pacific')
+    assert len(obs.index) == 12
+    assert obs['cfs'].dtype == float
+
+
+def test_get_wadoe_gauge_latest(tmp_path, monkeypatch):
+    monkeypatch.setenv('RIVER_LEVELS_CACHE', str(tmp_path))
+    monkeypatch.setattr(sources.requests, 'get', _FakeWadoe())
+    with pytest.warns(UserWarning, match='temperature'):
+        obs = river_levels.Gauge(gauge_id='45A070', source='WADOE').get_observations(['cfs', 'temperature'])
+
+    # the corrected duplicate reading is kept
+    assert len(obs.index) == 1
+    assert obs['cfs'].iloc[0] == 4465.0
+
+
+def test_wadoe_station_files_cached(tmp_path, monkeypatch):
+    monkeypatch.setenv('RIVER_LEVELS_CACHE', str(tmp_path))
+    fake_get = _FakeWadoe()
+    monkeypatch.setattr(sources.requests, 'get', fake_get)
+    adapter = sources.WadoeAdapter()
+
+    raw = adapter.fetch('45a070', ['cfs'])
+    assert raw['cfs'] == tmp_path / 'wadoe' / '45A070_DSG_FM.TXT'
+    assert adapter.fetch('45A070', ['cfs']) == raw
+    assert len(fake_get.requests) == 1
+    assert adapter.decode(raw)[0]['cfs'] is adapter.decode(raw)[0]['cfs']
+
+    # once stale, only downloaded if modified, and an unchanged file is not parsed again
+    parsed = adapter.decode(raw)[0]['cfs']
+    adapter.cache_ttl = 0
+    assert adapter.fetch('45A070', ['cfs']) == raw
+    assert len(fake_get.requests) == 2
+    assert fake_get.headers[-1]['If-Modified-Since'] == _FakeWadoe.last_modified
+    assert adapter.decode(raw)[0]['cfs'] is parsed
+
+    # a modified file replaces what was parsed before
+    fake_get.last_modified = 'Tue, 02 Jun 2020 08:00:00 GMT'
+    adapter.fetch('45A070', ['cfs'])
+    assert adapter.decode(raw)[0]['cfs'] is not parsed
+    assert len(adapter._parsed) == 1
+    assert list((tmp_path / 'wadoe').glob('*.part')) == []
+
+
+class _FakeSiteService(object):
+    """Serve recorded site service responses."""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, url, params=None, **kwargs):
+        self.requests.append(params)
+
+        # like the site service, respond not found when no sites match
+        if params.get('sites') == '99999999':
+            return type('Response', (object,), {'status_code': 404, 'text': 'No sites found matching all criteria'})()
+
+        fixture = 'usgs_site_series_wa.rdb' if 'seriesCatalogOutput' in params else 'usgs_site_expanded_wa.rdb'
+        res = _FakeResponse(dir_data / fixture)
+        res.text = res.content.decode()
+        return res
+
+
+@pytest.fixture
+def site_catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog.requests, 'get', _FakeSiteService())
+    return catalog.SiteCatalog(cache_path=tmp_path / 'sites.csv').refresh(state_codes='wa')
+
+
+def test_catalog_refresh_and_load(site_catalog):
+    # the site without coordinates is dropped
+    assert len(site_catalog) == 7
+    site = site_catalog.sites.set_index('site_id').loc['12149000']
+    assert site['drainage_area'] == 603.0
+    assert site['parameter_codes'] == '00010,00060,00065'
+
+    loaded = catalog.SiteCatalog.load(site_catalog.cache_path)
+    assert len(loaded) == 7
+    assert loaded.sites['site_id'].iloc[0] == '12147500'
+
+
+def test_catalog_nearest(site_catalog):
+    # near Leavenworth, between Peshastin and Plain
+    gauges = site_catalog.nearest(-120.66, 47.60, count=2)
+    assert [g.id for g in gauges] == ['12459000', '12457000']
+    assert gauges[0].location['y'] == 47.5832
+    assert isinstance(gauges[0], river_levels.Gauge)
+
+    # farther sites are found by expanding the search
+    assert [g.id for g in site_catalog.nearest(-120.66, 47.60, count=3, metrics='temperature')] == \
+        ['12462500', '12149000', '12113000']
+    assert len(site_catalog.nearest(-120.66, 47.60, count=10, max_distance=50)) == 3
+
+
+def test_catalog_locate(site_catalog):
+    gauges = site_catalog.locate(['12149000', '99999999'])
+    assert [g.id for g in gauges] == ['12149000', '99999999']
+    assert gauges[0].location['x'] == -121.9251 and gauges[1].location is None
+
+    # sites not in the catalog are requested from the site service, which responds not found for unknown sites
+    assert catalog.requests.get.requests[-1]['sites'] == '99999999'
+    assert len(site_catalog) == 7
+    assert site_catalog.sites['longitude'].dtype == float
+
+
+def test_catalog_bbox_and_polygon(site_catalog):
+    assert sorted(g.id for g in site_catalog.bbox(-122.0, 47.5, -121.5, 48.0)) == ['12134500', '12147500',
+                                                                                    '12149000']
+
+    # Esri JSON polygon around the Snoqualmie with a hole around Carnation
+    aoi = {'rings': [[[-122.0, 47.5], [-121.6, 47.5], [-121.6, 47.7], [-122.0, 47.7], [-122.0, 47.5]],
+                     [[-121.95, 47.65], [-121.9, 47.65], [-121.9, 47.68], [-121.95, 47.68], [-121.95, 47.65]]],
+           'spatialReference': {'wkid': 4326}}
+    assert [g.id for g in site_catalog.within(aoi)] == ['12147500']
+
+    # GeoJSON
+    aoi = {'type': 'Polygon', 'coordinates': [[[-121.0, 47.0], [-120.0, 47.0], [-120.5, 48.0], [-121.0, 47.0]]]}
+    assert sorted(g.id for g in site_catalog.within(aoi, metrics='height')) == ['12459000', '12462500']
+
+    # overlapping parts of a multipolygon both covering Carnation do not cancel out
+    aoi = {'type': 'MultiPolygon', 'coordinates': [
+        [[[-122.0, 47.6], [-121.9, 47.6], [-121.9, 47.7], [-122.0, 47.7], [-122.0, 47.6]]],
+        [[[-121.95, 47.62], [-121.85, 47.62], [-121.85, 47.72], [-121.95, 47.72], [-121.95, 47.62]]]]}
+    assert [g.id for g in site_catalog.within(aoi)] == ['12149000']
+
+
+def _fake_usgs_misaligned_get(url, params=None, **kwargs):
+    """Recorded response with temperature recorded five minutes after flow, and a couple of invalid values."""
+    res = _FakeResponse(dir_data / 'usgs_iv_01646500.json')
+    rjson = json.loads(res.content)
+    cfs_lst = rjson['value']['timeSeries'][0]['values'][0]['value']
+    tmp_lst = rjson['value']['timeSeries'][1]['values'][0]['value']
+    for obs in tmp_lst:
+        obs['dateTime'] = (pd.Timestamp(obs['dateTime']) + pd.Timedelta('5min')).isoformat()
+    cfs_lst[1]['value'] = 'Ice'
+    tmp_lst[2]['value'] = '-999999'
+    res.content = json.dumps(rjson).encode()
+    return res
+
+
+def test_get_usgs_gauge_misaligned_metrics(monkeypatch):
+    monkeypatch.setattr(sources.requests, 'get', _fake_usgs_misaligned_get)
+    gauge = river_levels.Gauge(gauge_id=usgs_id, source='USGS')
+    start = pytz.timezone('US/Eastern').localize(datetime(2020, 6, 1))
+    obs = gauge.get_observations(['cfs', 'temperature'], start_date=start)
+
+    # every timestamp from both metrics is kept, with all values as floats
+    assert list(obs.columns) == ['cfs', 'temperature']
+    assert len(obs.index) == 16
+    assert (obs.dtypes == float).all()
+    assert obs['cfs'].isna().sum() == 9
+    assert obs['temperature'].isna().sum() == 9
+    assert str(obs.index.tz) == 'US/Eastern'
+
+    # temperature aligned onto the flow timestamps
+    obs = gauge.get_observations(['cfs', 'temperature'], start_date=start, align_tolerance='5min')
+    assert len(obs.index) == 8
+    assert obs['temperature'].iloc[0] == 22.1
+    assert obs['temperature'].isna().sum() == 1
+
+
+def test_get_usgs_gauge_dict(monkeypatch):
+    monkeypatch.setattr(sources.requests, 'get', _fake_usgs_get)
+    obs = river_levels.Gauge(gauge_id=usgs_id, source='USGS').get_observations(['cfs', 'temperature'],
+                                                                               return_dataframe=False)
+    assert list(obs.values()) == [{'cfs': 5010.0, 'temperature': 21.7}]
+
+
+def test_observation_buffer_wraps_and_deduplicates():
+    buf = river_levels.ObservationBuffer(capacity=4, tz='US/Eastern')
+    idx = pd.date_range(datetime(2020, 6, 1), periods=6, freq='15min', tz='US/Eastern')
+    for ts, val in zip(idx, range(6)):
+        assert buf.append(ts, val)
+    assert len(buf) == 4
+
+    # a repeated timestamp replaces the value, and an older missing one is ignored
+    assert buf.append(idx[3], 30.0)
+    assert not buf.append(idx[0], 99.0)
+
+    times, values = buf.view()
+    assert list(values) == [2.0, 30.0, 4.0, 5.0]
+    assert buf.last_timestamp == idx[-1]
+
+    # windowed views are read-only slices of the same storage, always contiguous even after wrapping
+    times, values = buf.view(start_date=idx[3], end_date=idx[4])
+    assert list(values) == [30.0, 4.0]
+    assert np.shares_memory(values, buf._values)
+    assert not values.flags.writeable
+
+    ser = buf.to_series()
+    assert ser.index[0] == idx[2]
+    assert buf.nbytes == 4 * 2 * 16
+
+
+def test_observation_buffer_extend():
+    buf = river_levels.ObservationBuffer.for_window('1h', '15min')
+    assert buf.capacity == 4
+    idx = pd.date_range(datetime(2020, 6, 1), periods=3, freq='15min', tz='UTC')
+    assert buf.extend(idx, [1.0, 2.0, 3.0]) == 3
+
+    # overlapping batch replaces the overlap and keeps only the most recent that fit
+    idx = pd.date_range(datetime(2020, 6, 1, 0, 30), periods=5, freq='15min', tz='UTC')
+    assert buf.extend(idx, [30.0, 4.0, 5.0, 6.0, 7.0]) == 5
+    assert list(buf.view()[1]) == [4.0, 5.0, 6.0, 7.0]
+    assert buf.to_series().index[0] == pd.Timestamp('2020-06-01 00:45', tz='UTC')
+
+
+def test_gauge_values(monkeypatch):
+    monkeypatch.setattr(sources.requests, 'get', _fake_usgs_get)
+    gauge = river_levels.Gauge(gauge_id=usgs_id, source='USGS')
+    gauge.buffer_capacity = 6
+
+    start = pytz.timezone('US/Eastern').localize(datetime(2020, 6, 1))
+    assert gauge.extend(gauge.get_observations(['cfs', 'temperature'], start_date=start)) == 12
+    assert gauge.poll(['cfs', 'temperature']) == 2
+    assert gauge.append(start + pd.Timedelta('2h'), {'flow': 5000.0}) == 1
+
+    df = gauge.get_values()
+    assert list(df.columns) == ['cfs', 'temperature']
+    assert len(df.index) == 7
+    assert df['cfs'].iloc[-1] == 5000.0
+    assert str(df.index.tz) == 'US/Eastern'
+    assert len(gauge.get_values('temperature', start_date=start + pd.Timedelta('1h'))) == 4